@@ -1,28 +1,27 @@
 from bot.Bot import Bot, Command, SlackBot
+from bot.httpclient import http
+from crypto.budget import CreditBudget
+from crypto.CoinMarketCap import CoinMarketCapApi
+from crypto.snapshots import SnapshotStore
 from redis import StrictRedis
-from requests import get
 from collections import namedtuple
 from datetime import datetime
 from pytz import timezone, utc
 import time
-import re
 import os
 
 
 class ArbitrageBot(SlackBot):
-    BOT_REFRESH_TIME = 5 * 60  # CyrptoBot refreshes every 5 min
     HAX_TIME = 4 * 60 * 60  # Do hax for 4 hours at a time
     HAX_BUFFER = 5  # Do checks 5 sec before CryptoBot refresh
     HAX_CASH = 1e5  # Play with 100k
-    BOT_NAME = "cryptobot"
-    BOT_CHANNEL = (
-        "GBYUB4398"  # Channel for arbitragebot to ask cryptobot for latest BTC price
-    )
 
     def __init__(self, token, bot: Bot, db: StrictRedis) -> None:
         super().__init__(token, bot, db)
         self.hax_cash = ArbitrageBot.HAX_CASH
         self.coinList = list(_pollCmc())
+        # the same daily credits as cryptobot, counted in redis
+        self.cryptoApi = CoinMarketCapApi(SnapshotStore(db), CreditBudget(db))
 
     def onPredict(self, cmd: Command):
         # "crypto hax 1e5"
@@ -37,9 +36,7 @@ class ArbitrageBot(SlackBot):
         print("checking for hax until {}".format(_get_time_str(self.haxUntil)))
         # Poll cryptobot for latest BTC price
         # This should start the cache timer assuming nobody has requested prices in the last 5 min
-        self.botPriceHash, self.nextBotUpdateTime = self._pollCryptoBot(
-            channel, thread, self.coinList
-        )
+        self.botPriceHash, self.nextBotUpdateTime = self._pollCryptoBot(self.coinList)
         if args[0] is not None:
             try:
                 self.hax_cash = float(args[0])
@@ -102,7 +99,7 @@ class ArbitrageBot(SlackBot):
             # force cache update so we can track price
             _sleep_until(self.nextBotUpdateTime + 1)
             self.botPriceHash, self.nextBotUpdateTime = self._pollCryptoBot(
-                channel, thread, self.coinList
+                self.coinList
             )
 
             if bestGainz > 1.01:
@@ -114,60 +111,17 @@ class ArbitrageBot(SlackBot):
                 )
                 print("Profit of ${:0.2f}".format(profit))
 
-    def _pollCryptoBot(self, errChannel, errThread, coinList):
-        # Message cryptobot to get latest coin prices
-        self.api_call(
-            "chat.postMessage",
-            channel=ArbitrageBot.BOT_CHANNEL,
-            text="crypto price {}".format(" ".join(coinList)),
-            thread_ts=None,
-            as_user="true",
-        )
-        # Wait for cyrptobot reply
-        # {'text': '```btc: 8205.06```', 'username': 'cryptobot', 'icons': {'emoji': ':doge:'},
-        # 'bot_id': 'BBPBDQN2D', 'type': 'message', 'subtype': 'bot_message', 'team': 'T0339440S',
-        # 'channel': 'DBPQ0H3H9', 'event_ts': '1532846653.000009', 'ts': '1532846653.000009'}
-        timeout = time.time() + 10
-        while True:
-            events = list(
-                filter(
-                    lambda e: e.get("type") == "message"
-                    and e.get("channel") == ArbitrageBot.BOT_CHANNEL
-                    and e.get("username") == ArbitrageBot.BOT_NAME,
-                    self.rtm_read(),
-                )
-            )
-            if len(events) > 0:
-                botPriceHash = {}
-                prices = events[0].get("text").replace("`", "")
-                for coinAndPrice in prices.split(", "):
-                    # dash price comes out as a telephone number for some reason, skip it for now
-                    # dash: <tel:206.3474357|206.3474357>
-                    try:
-                        m = re.search("([a-zA-Z0-9]+): ([0-9.]+)", coinAndPrice)
-                        coin = m.group(1).lower()
-                        price = float(m.group(2))
-                        botPriceHash[coin] = price
-                    except:
-                        print("failed to parse {}".format(coinAndPrice))
-                nextBotUpdateTime = time.time() + ArbitrageBot.BOT_REFRESH_TIME
-                return [botPriceHash, nextBotUpdateTime]
-            if time.time() > timeout:
-                print(
-                    "hax timed out waiting for {} reply!".format(ArbitrageBot.BOT_NAME)
-                )
-                self.postMessage(
-                    errChannel,
-                    "hax timed out waiting for {} reply :sob:".format(
-                        ArbitrageBot.BOT_NAME
-                    ),
-                    errThread,
-                )
-                return [
-                    self.botPriceHash,
-                    self.nextBotUpdateTime + ArbitrageBot.BOT_REFRESH_TIME,
-                ]
-            time.sleep(0.1)
+    def _pollCryptoBot(self, coinList):
+        # cryptobot trades at the prices of the shared snapshot, so read that
+        # instead of asking it in slack; this refreshes the snapshot if it
+        # expired, like a "crypto price" command would
+        snapshot = self.cryptoApi.getSnapshot()
+        botPriceHash = {
+            coin: snapshot.prices[coin] for coin in coinList if coin in snapshot.prices
+        }
+        # snapshots are kept for as long as the credit budget requires
+        nextBotUpdateTime = (snapshot.fetched_at_ms + self.cryptoApi.ttlMs()) / 1000
+        return [botPriceHash, nextBotUpdateTime]
 
     def _kaha_msg(self, channel, thread, msg):
         self.api_call(
@@ -200,7 +154,7 @@ def _sleep_until(timestamp):
 
 def _pollCmc():
     # use exact same query as cryptobot otherwise prices may be different
-    resp = get(
+    resp = http.get(
         "https://api.coinmarketcap.com/v2/ticker/?limit=100&sort=rank&structure=array"
     ).json()
     coinDict = {}
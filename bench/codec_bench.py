@@ -0,0 +1,110 @@
+# benchmark for the if/user codec
+# usage: python -m bench.codec_bench [--users 1000] [--ifs 5] [-n 5]
+#
+# encodes and decodes every if (as stored in the ifs hashes) and every whole
+# user (as the old json blobs and migrate.py use them), with dataclasses_json
+# (the previous way) and with crypto/codec.py, and compares the bytes written.
+
+from crypto.CryptoTrader import Alert, Buy, Condition, If, Sell, User, codec
+import argparse
+import random
+import time
+
+
+def users(n: int, ifs: int) -> list:
+    coins = ["btc", "eth", "xrp", "ltc", "doge", "ada", "dot", "bch"]
+    everyone = []
+    for u in range(n):
+        actions = [
+            Alert(msg="Alert! The price of btc is &gt; 9000."),
+            Buy(coin=random.choice(coins), qty="50%"),
+            Sell(coin=random.choice(coins), qty=str(random.uniform(0, 10))),
+        ]
+        everyone.append(
+            User(
+                "user{}".format(u),
+                random.uniform(0, 1e5),
+                {c: random.uniform(0, 100) for c in random.sample(coins, 4)},
+                [
+                    If(
+                        i,
+                        Condition(
+                            random.choice(coins),
+                            random.choice(["&gt;", "&lt;"]),
+                            random.uniform(0, 1e4),
+                        ),
+                        random.choice(actions),
+                    )
+                    for i in range(1, ifs + 1)
+                ],
+            )
+        )
+    return everyone
+
+
+def timed(label: str, fn, items: list, n: int) -> float:
+    start = time.perf_counter()
+    for _ in range(n):
+        for item in items:
+            fn(item)
+    rate = len(items) * n / (time.perf_counter() - start)
+    print("  {:<24} {:10.0f} /sec".format(label, rate))
+    return rate
+
+
+def compare(title: str, objects: list, old, new, n: int) -> None:
+    print(title)
+    oldEncode, oldDecode = old
+    newEncode, newDecode = new
+    oldData = [oldEncode(o) for o in objects]
+    newData = [newEncode(o) for o in objects]
+    assert [newDecode(d) for d in newData] == [newDecode(d) for d in oldData]
+    encodes = [
+        timed(label, fn, objects, n)
+        for label, fn in [
+            ("dataclasses_json encode", oldEncode),
+            ("codec encode", newEncode),
+        ]
+    ]
+    decodes = [
+        timed(label, fn, data, n)
+        for label, fn, data in [
+            ("dataclasses_json decode", oldDecode, oldData),
+            ("codec decode", newDecode, newData),
+        ]
+    ]
+    oldBytes = sum(len(d) for d in oldData) / len(oldData)
+    newBytes = sum(len(d) for d in newData) / len(newData)
+    print(
+        "  encode {:.1f}x, decode {:.1f}x faster; {:.0f} -> {:.0f} bytes each".format(
+            encodes[1] / encodes[0], decodes[1] / decodes[0], oldBytes, newBytes
+        )
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--ifs", type=int, default=5, help="per user")
+    parser.add_argument("-n", type=int, default=5, help="repetitions")
+    args = parser.parse_args()
+
+    everyone = users(args.users, args.ifs)
+    compare(
+        "ifs",
+        [i for u in everyone for i in u.ifs],
+        (lambda i: i.to_json(), If.from_json),
+        (codec.encodeIf, codec.decodeIf),
+        args.n,
+    )
+    compare(
+        "users",
+        everyone,
+        (lambda u: u.to_json(), User.from_json),
+        (codec.encodeUser, codec.decodeUser),
+        args.n,
+    )
+
+
+if __name__ == "__main__":
+    main()
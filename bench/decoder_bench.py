@@ -0,0 +1,140 @@
+# benchmark for the listings decoder
+# usage: python -m bench.decoder_bench [--payload listings.json] [-n 200]
+#
+# --payload decodes a recorded cryptocurrency/listings/latest response.
+# without it two synthetic 200-listing payloads are used: one with exactly
+# the fields of our models, one with the extra fields the live API returns
+# (where the old decoder gives up and leaves listings as dicts).
+
+from crypto.models import Listing, Listings, ListingsDecoder, Quote, Status
+from json import JSONDecoder, dumps, loads
+import argparse
+import random
+import time
+
+LISTING_FIELDS = (
+    "id",
+    "name",
+    "symbol",
+    "slug",
+    "circulating_supply",
+    "total_supply",
+    "max_supply",
+    "date_added",
+    "num_market_pairs",
+    "tags",
+    "platform",
+    "cmc_rank",
+    "last_updated",
+    "quote",
+)
+QUOTE_FIELDS = (
+    "price",
+    "volume_24h",
+    "percent_change_1h",
+    "percent_change_24h",
+    "percent_change_7d",
+    "market_cap",
+    "last_updated",
+)
+STATUS_FIELDS = ("timestamp", "error_code", "error_message", "elapsed", "credit_count")
+
+
+class OldFastJsonDecoder(JSONDecoder):
+    # the previous crypto/decoders.py FastJsonDecoder, for comparison
+    def __init__(self, *args, **kwargs):
+        JSONDecoder.__init__(self, object_hook=self.hook, *args, **kwargs)
+
+    def jsonToClass(self):
+        return {
+            STATUS_FIELDS: Status,
+            LISTING_FIELDS: Listing,
+            QUOTE_FIELDS: Quote,
+            ("status", "data"): Listings,
+        }
+
+    def hook(self, obj):
+        for keys, C in self.jsonToClass().items():
+            if set(keys) == set(obj.keys()):
+                args = []
+                for key in list(keys):
+                    args.append(obj[key])
+                return C(*args)
+        return obj
+
+
+def payload(listings: int, extraFields: bool) -> str:
+    data = []
+    for rank in range(1, listings + 1):
+        quote = {f: random.uniform(0, 1e9) for f in QUOTE_FIELDS}
+        quote["last_updated"] = "2019-01-01T00:00:00.000Z"
+        listing = {
+            "id": rank,
+            "name": "Coin {}".format(rank),
+            "symbol": "C{}".format(rank),
+            "slug": "coin-{}".format(rank),
+            "circulating_supply": random.uniform(0, 1e9),
+            "total_supply": random.uniform(0, 1e9),
+            "max_supply": None,
+            "date_added": "2013-04-28T00:00:00.000Z",
+            "num_market_pairs": random.randint(1, 9000),
+            "tags": ["mineable"],
+            "platform": None,
+            "cmc_rank": rank,
+            "last_updated": "2019-01-01T00:00:00.000Z",
+            "quote": {"USD": quote},
+        }
+        if extraFields:
+            quote["volume_change_24h"] = random.uniform(-50, 50)
+            quote["percent_change_30d"] = random.uniform(-50, 50)
+            quote["market_cap_dominance"] = random.uniform(0, 50)
+            quote["fully_diluted_market_cap"] = random.uniform(0, 1e9)
+            listing["infinite_supply"] = False
+            listing["self_reported_circulating_supply"] = None
+        data.append(listing)
+    status = {f: 0 for f in STATUS_FIELDS}
+    return dumps({"status": status, "data": data})
+
+
+def built(listings) -> str:
+    if not isinstance(listings, Listings):
+        return "dict"
+    if all(isinstance(l, Listing) for l in listings.data) and all(
+        isinstance(l.quote["USD"], Quote) for l in listings.data
+    ):
+        return "Listings/Listing/Quote"
+    return "partly dicts"
+
+
+def run(label: str, text: str, n: int) -> None:
+    results = []
+    for name, decoder in [("old", OldFastJsonDecoder), ("new", ListingsDecoder)]:
+        start = time.perf_counter()
+        for _ in range(n):
+            listings = loads(text, cls=decoder)
+        elapsed = time.perf_counter() - start
+        results.append(elapsed)
+        print(
+            "{label:<22} {name}: {ms:7.2f} ms/decode -> {built}".format(
+                label=label, name=name, ms=elapsed / n * 1000, built=built(listings)
+            )
+        )
+    print("{:<22} speedup: {:.1f}x".format(label, results[0] / results[1]))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--payload", help="recorded listings/latest response")
+    parser.add_argument("-n", type=int, default=200, help="decodes per decoder")
+    args = parser.parse_args()
+
+    if args.payload:
+        with open(args.payload) as f:
+            run("recorded payload", f.read(), args.n)
+        return
+    run("exact fields", payload(200, False), args.n)
+    run("live API fields", payload(200, True), args.n)
+
+
+if __name__ == "__main__":
+    main()
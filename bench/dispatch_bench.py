@@ -0,0 +1,75 @@
+# micro-benchmark for trigger dispatch
+# usage: python -m bench.dispatch_bench [n]
+
+from bot.dispatch import TriggerIndex
+import sys
+import time
+
+TRIGGERS = [
+    "chess start",
+    "chess claim",
+    "chess board",
+    "chess move",
+    "chess takeback",
+    "chess forfeit",
+    "chess record",
+    "chess leaderboard",
+    "chess help",
+    "crypto prices",
+    "crypto price",
+    "crypto buy",
+    "crypto sell",
+    "crypto leaderboard",
+    "crypto top",
+    "crypto help",
+    "crypto play",
+    "crypto quit",
+    "crypto ping",
+    "crypto if",
+    "crypto when",
+    "Reminder: crypto ping",
+]
+
+COMMANDS = [
+    "crypto price btc eth",
+    "crypto buy eth 200",
+    "chess move Nc3",
+    "crypto if btc > 100 alert",
+    "Reminder: crypto ping",
+]
+
+CHATTER = [
+    "did anyone see the game last night?",
+    "lunch at noon, anyone in?",
+    "cryptocurrency is a bubble",
+    "chessboards are on sale",
+    "ok",
+]
+
+
+def linearScan(text: str):
+    # the previous SlackBot._messageEventToCommand strategy
+    for trigger in TRIGGERS:
+        if text.lower().startswith(trigger.lower()):
+            return trigger
+    return None
+
+
+def run(label: str, fn, messages, n: int) -> None:
+    start = time.perf_counter()
+    for i in range(n):
+        fn(messages[i % len(messages)])
+    elapsed = time.perf_counter() - start
+    print("{:<28} {:>12,.0f} msgs/sec".format(label, n / elapsed))
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    index = TriggerIndex()
+    for trigger in TRIGGERS:
+        index.add(trigger)
+
+    run("linear scan, commands", linearScan, COMMANDS, n)
+    run("trie, commands", index.match, COMMANDS, n)
+    run("linear scan, non-commands", linearScan, CHATTER, n)
+    run("trie, non-commands", index.match, CHATTER, n)
@@ -0,0 +1,151 @@
+# a local stand-in for the Slack Web API and RTM websocket.
+# FakeSlack.attach(client) plugs it in underneath a SlackClient (or any
+# SlackBot), at the same level as the real HTTP and websocket transports:
+# api_call() still goes through SlackBot.api_call and its metrics, and
+# listen()/listenAsync() read frames off a real local socket.
+
+from collections import Counter
+from ssl import SSLWantReadError
+from threading import Lock
+from typing import Dict, List
+import json
+import socket
+import time
+
+
+class FakeSlack:
+    def __init__(self, users: int = 50, latency: float = 0.0) -> None:
+        self.latency = latency  # seconds added to every Web API call
+        self.users = {
+            "U{:05d}".format(i): {"id": "U{:05d}".format(i), "name": "user{}".format(i)}
+            for i in range(users)
+        }
+        self.calls: Counter = Counter()
+        self.messages: List[Dict] = []
+        self.history: List[Dict] = []  # every event pushed, for backfills
+        self._files: Dict[str, Dict] = {}
+        self._sockets: List[socket.socket] = []
+        self._lock = Lock()
+        self._ids = 0
+
+    def attach(self, client, rtm: bool = True) -> None:
+        # routes client's Web API calls (and RTM reads, if rtm) to this fake
+        client.server.api_call = self._serverApiCall
+        if rtm:
+            client.rtm_connect = lambda *args, **kwargs: self._connect(client)
+            self._connect(client)
+
+    def push(self, event: Dict) -> None:
+        # sends an RTM event to every attached client
+        self.history.append(event)
+        frame = json.dumps(event).encode() + b"\n"
+        for sock in self._sockets:
+            sock.sendall(frame)
+
+    def drop(self) -> None:
+        # closes every RTM connection, events pushed until the clients
+        # reconnect are only available through conversations.history
+        for sock in self._sockets:
+            sock.close()
+        self._sockets = []
+
+    def message(self, user: str, text: str, channel: str = "C0BENCH", thread=None):
+        event = {
+            "type": "message",
+            "channel": channel,
+            "user": user,
+            "text": text,
+            "ts": "{:.6f}".format(time.time()),
+        }
+        if thread:
+            event["thread_ts"] = thread
+        self.push(event)
+        return event
+
+    def api_call(self, method: str, **kwargs) -> Dict:
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.calls[method] += 1
+            self._ids += 1
+            id = str(self._ids)
+        if method == "chat.postMessage":
+            with self._lock:
+                self.messages.append(kwargs)
+            return {"ok": True, "channel": kwargs.get("channel"), "ts": id}
+        if method == "files.upload":
+            self._files[id] = kwargs
+            return {"ok": True, "file": {"id": id}}
+        if method == "files.delete":
+            found = self._files.pop(kwargs.get("file"), None)
+            return {"ok": found is not None}
+        if method == "users.info":
+            user = self.users.get(kwargs.get("user"))
+            if user is None:
+                return {"ok": False, "error": "user_not_found"}
+            return {"ok": True, "user": user}
+        if method in ("conversations.history", "conversations.replies"):
+            return self._history(
+                kwargs["channel"], float(kwargs.get("oldest") or 0), kwargs.get("ts")
+            )
+        if method == "users.list":
+            return self._usersList(
+                int(kwargs.get("limit") or 200), kwargs.get("cursor")
+            )
+        return {"ok": False, "error": "unknown_method"}
+
+    def _history(self, channel: str, oldest: float, thread) -> Dict:
+        messages = [
+            dict(e)
+            for e in reversed(self.history)
+            if e.get("channel") == channel
+            and float(e["ts"]) > oldest
+            and (thread is None) == ("thread_ts" not in e)
+            and (thread is None or e.get("thread_ts") == thread)
+        ]
+        return {"ok": True, "messages": messages, "has_more": False}
+
+    def _usersList(self, limit: int, cursor) -> Dict:
+        ids = sorted(self.users.keys())
+        start = int(cursor) if cursor else 0
+        page = ids[start : start + limit]
+        nextCursor = str(start + limit) if start + limit < len(ids) else ""
+        return {
+            "ok": True,
+            "members": [self.users[i] for i in page],
+            "response_metadata": {"next_cursor": nextCursor},
+        }
+
+    def _serverApiCall(self, method, timeout=None, **kwargs) -> str:
+        # slackclient's Server.api_call returns the raw response text
+        result = self.api_call(method, **kwargs)
+        result["headers"] = {}
+        return json.dumps(result)
+
+    def _connect(self, client) -> bool:
+        ours, theirs = socket.socketpair()
+        ours.setblocking(False)
+        client.server.websocket = _FakeWebsocket(ours)
+        client.server.connected = True
+        self._sockets.append(theirs)
+        return True
+
+
+class _FakeWebsocket:
+    # enough of websocket-client's WebSocket for Server.websocket_safe_read
+    def __init__(self, sock: socket.socket) -> None:
+        self.sock = sock
+        self._buffer = b""
+
+    def recv(self) -> str:
+        while b"\n" not in self._buffer:
+            try:
+                chunk = self.sock.recv(65536)
+            except BlockingIOError:
+                # what the TLS layer raises when there is nothing to read
+                raise SSLWantReadError(2, "The operation did not complete")
+            if not chunk:
+                raise ConnectionError("RTM connection closed")
+            self._buffer += chunk
+        frame, self._buffer = self._buffer.split(b"\n", 1)
+        return frame.decode()
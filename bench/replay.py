@@ -0,0 +1,262 @@
+# replays message events into ChessBot and CryptoBot through a SlackMux,
+# against the fake Slack in bench/fakeslack.py and a local redis, and
+# reports commands/sec, latency per trigger and outbound calls per command.
+#
+# usage: python -m bench.replay [--bots chess,crypto] [--rate 50] [--count 500]
+#                               [--events recorded.jsonl] [--latency 0.05]
+#                               [--market recorded/ --speed 60]
+#
+# --events replays recorded RTM message events (one JSON object per line)
+# instead of the synthetic traffic below. --market replays recorded prices
+# (see crypto/sources.py ReplayPriceSource) instead of a random walk.
+
+from bench.fakeslack import FakeSlack
+from bot.Bot import Bot
+from bot.mux import SlackMux
+from bot.redis import redis
+from bot.users import directory
+from chessbot.ChessBot import ChessBot
+from collections import defaultdict
+from crypto.CryptoBot import CryptoBot
+from crypto.CryptoTrader import CryptoTrader
+from crypto.models import Snapshot
+from crypto.sources import PriceSource, ReplayPriceSource, snapshotOf
+from run import registerChessRoutes, registerCryptoRoutes
+from slackclient import SlackClient
+from threading import Lock, Thread
+from typing import Dict, Iterator, List, Tuple
+import argparse
+import chess
+import chessbot.board
+import chessbot.ChessBot
+import json
+import random
+import time
+
+TOKEN = "xoxb-replay"
+GROUP = "replay"
+
+
+class FakeMarket(PriceSource):
+    # synthetic CoinMarketCap listings, prices random walk on every fetch
+    def __init__(self, coins: int = 200) -> None:
+        symbols = ["BTC", "ETH", "XRP", "LTC", "DOGE"] + [
+            "C{:03d}".format(i) for i in range(coins - 5)
+        ]
+        self.prices = {s: random.uniform(0.01, 10000) for s in symbols}
+
+    def getSnapshot(self) -> Snapshot:
+        for symbol in self.prices:
+            self.prices[symbol] *= random.uniform(0.99, 1.01)
+        return snapshotOf(self.prices, time.time())
+
+
+class Recorder:
+    # wraps registered callbacks to time them from the moment the event was sent
+    def __init__(self) -> None:
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.last = 0.0
+        self._lock = Lock()
+
+    def wrap(self, bot) -> None:
+        for trigger, callbacks in bot._triggers.items():
+            for mc in callbacks:
+                mc.callback = self._timed(trigger, mc.callback)
+
+    def count(self) -> int:
+        return sum(len(v) for v in self.latencies.values())
+
+    def _timed(self, trigger: str, callback):
+        def timed(cmd):
+            try:
+                callback(cmd)
+            finally:
+                with self._lock:
+                    self.last = time.time()
+                    self.latencies[trigger].append(self.last - float(cmd.event.ts))
+
+        return timed
+
+
+def cryptoTraffic(users: List[str]) -> Iterator[Tuple[str, str, str]]:
+    mix = [
+        ("crypto price btc eth", 30),
+        ("crypto buy btc 0.001", 15),
+        ("crypto sell btc 0.001", 10),
+        ("crypto if btc > 99999999 alert", 5),
+        ("crypto if", 5),
+        ("crypto ping", 10),
+        ("crypto help", 5),
+        ("is the market up today?", 20),
+    ]
+    texts, weights = zip(*mix)
+    while True:
+        yield random.choice(users), random.choices(texts, weights)[0], None
+
+
+def chessTraffic(users: List[str]) -> Iterator[Tuple[str, str, str]]:
+    # plays random legal games, one slack thread per game
+    while True:
+        white, black = random.sample(users, 2)
+        thread = "{:.6f}".format(time.time())
+        board = chess.Board()
+        yield white, "chess start", thread
+        yield white, "chess claim white", thread
+        yield black, "chess claim black", thread
+        while not board.is_game_over() and len(board.move_stack) < 40:
+            move = random.choice(list(board.legal_moves))
+            user = white if board.turn else black
+            yield user, "chess move {}".format(board.san(move)), thread
+            board.push(move)
+        yield white, "chess forfeit", thread
+
+
+def recordedTraffic(path: str) -> Iterator[Tuple[str, str, str]]:
+    with open(path) as f:
+        for line in f:
+            event = json.loads(line)
+            if event.get("type") == "message" and "text" in event:
+                yield event.get("user"), event["text"], event.get("thread_ts")
+
+
+def interleave(*sources: Iterator) -> Iterator:
+    while True:
+        for source in sources:
+            try:
+                yield next(source)
+            except StopIteration:
+                return
+
+
+def percentile(values: List[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bots", default="chess,crypto")
+    parser.add_argument("--rate", type=float, default=50.0, help="events/sec")
+    parser.add_argument("--count", type=int, default=500, help="events to send")
+    parser.add_argument("--events", help="JSONL file of recorded message events")
+    parser.add_argument("--latency", type=float, default=0.0, help="fake API delay")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument(
+        "--market", help="recorded listings dir or price history file to replay"
+    )
+    parser.add_argument(
+        "--speed", type=float, default=60.0, help="market replay speedup"
+    )
+    parser.add_argument(
+        "--online", action="store_true", help="really call is.gd and lichess"
+    )
+    args = parser.parse_args()
+    bots = args.bots.split(",")
+
+    if not args.online:
+        chessbot.board.shorten_url = lambda url: url
+        chessbot.ChessBot.upload_analysis = lambda pgn: "https://lichess.org/replay"
+
+    fake = FakeSlack(args.users, args.latency)
+    directory.client = SlackClient(TOKEN)
+    fake.attach(directory.client, rtm=False)
+    directory.load()
+
+    mux = SlackMux(TOKEN, connect=False)
+    fake.attach(mux)
+    recorder = Recorder()
+    sources = []
+    routed = []
+
+    if "chess" in bots:
+        chessBot = ChessBot(TOKEN, Bot("chessbot", ":chess:"), redis, connect=False)
+        fake.attach(chessBot, rtm=False)
+        registerChessRoutes(chessBot)
+        sources.append(chessTraffic(list(fake.users.keys())))
+        routed.append(chessBot)
+
+    if "crypto" in bots:
+        market = (
+            ReplayPriceSource(args.market, args.speed, loop=True)
+            if args.market
+            else FakeMarket()
+        )
+        trader = CryptoTrader(redis, GROUP, market)
+        cryptoBot = CryptoBot(TOKEN, Bot("cryptobot", ":doge:"), trader, connect=False)
+        cryptoBot.pollTimer.cancel()
+        fake.attach(cryptoBot, rtm=False)
+        registerCryptoRoutes(cryptoBot)
+        sources.append(cryptoTraffic(list(fake.users.keys())))
+        routed.append(cryptoBot)
+
+    for bot in routed:
+        recorder.wrap(bot)
+        mux.route(bot)
+
+    if args.events:
+        sources = [recordedTraffic(args.events)]
+
+    Thread(target=mux.listenAsync, daemon=True).start()
+    time.sleep(0.2)
+    fake.calls.clear()
+
+    traffic = interleave(*sources)
+    start = time.time()
+    sent = 0
+    for i in range(args.count):
+        try:
+            user, text, thread = next(traffic)
+        except StopIteration:
+            break
+        _sleepUntil(start + i / args.rate)
+        fake.message(user, text, thread=thread)
+        sent += 1
+
+    commands = 0
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        commands = recorder.count()
+        time.sleep(0.25)
+        if recorder.count() == commands:
+            break
+    elapsed = recorder.last - start
+    for bot in routed:
+        bot.outbox.flush(timeout=60)
+
+    outbound = sum(n for m, n in fake.calls.items() if not m.startswith("users."))
+    print(
+        "{sent} events, {c} commands in {t:.1f}s: {cps:.1f} commands/sec, "
+        "{o:.2f} outbound calls/command".format(
+            sent=sent,
+            c=commands,
+            t=elapsed,
+            cps=commands / elapsed,
+            o=outbound / max(commands, 1),
+        )
+    )
+    print(
+        "{:<24} {:>6} {:>9} {:>9} {:>9}".format(
+            "trigger", "n", "p50 ms", "p95 ms", "p99 ms"
+        )
+    )
+    for trigger, latencies in sorted(recorder.latencies.items()):
+        print(
+            "{:<24} {:>6} {:>9.1f} {:>9.1f} {:>9.1f}".format(
+                trigger,
+                len(latencies),
+                percentile(latencies, 0.5) * 1000,
+                percentile(latencies, 0.95) * 1000,
+                percentile(latencies, 0.99) * 1000,
+            )
+        )
+    print("outbound calls: {calls}".format(calls=dict(fake.calls)))
+
+
+def _sleepUntil(t: float) -> None:
+    delay = t - time.time()
+    if delay > 0:
+        time.sleep(delay)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# command latency of SlackBot.listen() vs SlackBot.listenAsync() against a
+# fake RTM websocket (a local socket pair)
+# usage: python -m bench.rtm_latency_bench [commands] [rate/sec]
+
+from bot.Bot import SlackBot, Bot, allMessageEvents
+from types import SimpleNamespace
+import json
+import random
+import socket
+import sys
+import threading
+import time
+
+
+class FakeRtmBot(SlackBot):
+    def __init__(self) -> None:
+        self._theirs: socket.socket = None  # type: ignore
+        super().__init__("xoxb-fake", Bot("bench", ":stopwatch:"), None)
+        self.latencies = []
+        self.register("crypto ping", self.onPing, allMessageEvents)
+
+    def rtm_connect(self, *args, **kwargs):
+        ours, self._theirs = socket.socketpair()
+        ours.setblocking(False)
+        self._buffer = b""
+        self.server.websocket = SimpleNamespace(sock=ours)
+        return True
+
+    def rtm_read(self):
+        sock = self.server.websocket.sock
+        try:
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                self._buffer += chunk
+        except BlockingIOError:
+            pass
+        *lines, self._buffer = self._buffer.split(b"\n")
+        return [json.loads(line) for line in lines]
+
+    def send(self, text: str) -> None:
+        event = {"type": "message", "text": text, "ts": str(time.time())}
+        self._theirs.sendall(json.dumps(event).encode() + b"\n")
+
+    def onPing(self, cmd):
+        self.latencies.append(time.time() - float(cmd.event.ts))
+
+
+def percentile(values, p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run(mode: str, n: int, rate: float) -> None:
+    bot = FakeRtmBot()
+    listener = bot.listen if mode == "listen" else bot.listenAsync
+    threading.Thread(target=listener, daemon=True).start()
+    time.sleep(0.1)
+    for _ in range(n):
+        bot.send("crypto ping")
+        time.sleep(random.expovariate(rate))
+    deadline = time.time() + 2
+    while len(bot.latencies) < n and time.time() < deadline:
+        time.sleep(0.05)
+    print(
+        "{:<12} n={:<5} p50={:>8.2f}ms p99={:>8.2f}ms".format(
+            mode,
+            len(bot.latencies),
+            percentile(bot.latencies, 0.5) * 1000,
+            percentile(bot.latencies, 0.99) * 1000,
+        )
+    )
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    rate = float(sys.argv[2]) if len(sys.argv) > 2 else 20.0
+    run("listen", n, rate)
+    run("listenAsync", n, rate)
@@ -0,0 +1,122 @@
+# benchmark for the columnar listings table
+# usage: python -m bench.table_bench [--listings 5000] [--users 10000] [-n 20]
+#
+# compares, on one snapshot: top N by rank, a percent change screen and
+# valuing every user's portfolio, done over Listing dataclasses and dicts
+# (the previous way) and over the ListingsTable columns.
+
+from crypto.CryptoTrader import User
+from crypto.models import Listing, Listings, Quote, Snapshot, Status
+from crypto.table import Holdings
+import argparse
+import random
+import time
+
+
+def snapshot(listings: int) -> Snapshot:
+    data = []
+    for rank in random.sample(range(1, listings + 1), listings):
+        symbol = "C{}".format(rank)
+        quote = Quote(
+            random.uniform(0.001, 10000),
+            random.uniform(0, 1e9),
+            random.uniform(-20, 20),
+            random.uniform(-30, 30),
+            random.uniform(-50, 50),
+            random.uniform(0, 1e11),
+            "",
+        )
+        data.append(
+            Listing(
+                rank,
+                symbol,
+                symbol,
+                symbol.lower(),
+                0,
+                0,
+                0,
+                "",
+                0,
+                [],
+                "",
+                rank,
+                "",
+                {"USD": quote},
+            )
+        )
+    return Snapshot.of(Listings(Status("", 0, "", 0, 1), data), 0)
+
+
+def users(n: int, symbols) -> list:
+    return [
+        User(
+            "user{}".format(i),
+            random.uniform(0, 1e5),
+            {
+                s: random.uniform(0, 100)
+                for s in random.sample(symbols, random.randint(1, 10))
+            },
+        )
+        for i in range(n)
+    ]
+
+
+def timed(label: str, fn, n: int) -> float:
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    elapsed = (time.perf_counter() - start) / n
+    print("  {:<10} {:9.3f} ms".format(label, elapsed * 1000))
+    return elapsed
+
+
+def compare(title: str, old, new, n: int) -> None:
+    print(title)
+    before = timed("objects", old, n)
+    after = timed("table", new, n)
+    print("  speedup    {:9.1f}x".format(before / after))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--listings", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("-n", type=int, default=20, help="repetitions")
+    args = parser.parse_args()
+
+    snap = snapshot(args.listings)
+    table = snap.table
+    everyone = users(args.users, list(snap.prices.keys()))
+    holdings = Holdings([u.portfolio for u in everyone])
+
+    compare(
+        "top 10 by rank",
+        lambda: sorted(snap.listings.data, key=lambda l: l.cmc_rank)[0:10],
+        lambda: [snap.ranked[r] for r in table.top(10)],
+        args.n,
+    )
+    compare(
+        "24h movers (|change| >= 25%)",
+        lambda: sorted(
+            (
+                (l.symbol.lower(), l.quote["USD"].percent_change_24h)
+                for l in snap.listings.data
+                if abs(l.quote["USD"].percent_change_24h) >= 25
+            ),
+            key=lambda m: -abs(m[1]),
+        ),
+        lambda: table.screen("percent_change_24h", 25),
+        args.n,
+    )
+    compare(
+        "value {} portfolios".format(args.users),
+        lambda: [u.value(snap.prices) for u in everyone],
+        lambda: table.values(holdings),
+        args.n,
+    )
+    print("building Holdings for {} users:".format(args.users))
+    timed("once", lambda: Holdings([u.portfolio for u in everyone]), args.n)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# benchmark for buy/sell under concurrent load, against a local redis
+# usage: python -m bench.trade_bench [--threads 8] [--trades 200] [--users 4]
+#
+# every thread buys 1 coin at a fixed price, over and over, on a few shared
+# users. compares the previous read-modify-write (get the user's json, change
+# it in python, set it back) with CryptoTrader.buy, which runs the trade as
+# one script inside redis. with no lost updates each user ends up holding exactly
+# the number of coins bought for them.
+
+from bot.redis import redis
+from crypto.CryptoTrader import CryptoTrader, User
+from crypto.sources import PriceSource, snapshotOf
+from threading import Thread
+import argparse
+import time
+
+GROUP = "bench.trade"
+PRICE = 10.0
+
+
+class FixedMarket(PriceSource):
+    def __init__(self) -> None:
+        self.snapshot = snapshotOf({"btc": PRICE}, time.time())
+
+    def getSnapshot(self):
+        return self.snapshot
+
+
+def oldKey(user_name: str) -> str:
+    return "cryptoTrader.{group}.json.{user_name}".format(
+        group=GROUP, user_name=user_name
+    )
+
+
+def oldBuy(trader: CryptoTrader, user_name: str) -> None:
+    # the previous CryptoTrader.buy, minus the quantity parsing
+    saved = redis.get(oldKey(user_name))
+    if saved:
+        user = User.from_json(saved)  # type: ignore
+    else:
+        user = User(user_name, CryptoTrader.INITIAL_POT_SIZE, {})
+    prices = trader._getPrices(["btc"])
+    purchasePrice = prices["btc"] * 1
+    if user.balance >= purchasePrice:
+        user.portfolio["btc"] = user.portfolio.get("btc", 0) + 1
+        user.balance = user.balance - purchasePrice
+        redis.set(oldKey(user_name), user.to_json())  # type: ignore
+
+
+def oldHolding(trader: CryptoTrader, user_name: str) -> float:
+    return User.from_json(redis.get(oldKey(user_name))).portfolio["btc"]  # type: ignore
+
+
+def newBuy(trader: CryptoTrader, user_name: str) -> None:
+    trader.buy(user_name, "btc", "1")
+
+
+def newHolding(trader: CryptoTrader, user_name: str) -> float:
+    return trader._getUser(user_name).portfolio["btc"]
+
+
+def run(label: str, buy, holding, args) -> None:
+    trader = CryptoTrader(redis, GROUP, FixedMarket())
+    names = ["user{}".format(u) for u in range(args.users)]
+    for name in names:
+        trader.delete_user(name)
+        redis.delete(oldKey(name))
+
+    def work(t: int) -> None:
+        for n in range(args.trades):
+            buy(trader, names[(t + n) % len(names)])
+
+    threads = [Thread(target=work, args=(t,)) for t in range(args.threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    total = args.threads * args.trades
+    held = sum(holding(trader, name) for name in names)
+    print(
+        "{label:<18} {rate:8.0f} trades/sec, {lost} of {total} trades lost".format(
+            label=label, rate=total / elapsed, lost=int(total - held), total=total
+        )
+    )
+    for name in names:
+        trader.delete_user(name)
+        redis.delete(oldKey(name))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--trades", type=int, default=200, help="per thread")
+    parser.add_argument("--users", type=int, default=4)
+    args = parser.parse_args()
+
+    run("read-modify-write", oldBuy, oldHolding, args)
+    run("redis script", newBuy, newHolding, args)
+
+
+if __name__ == "__main__":
+    main()
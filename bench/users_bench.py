@@ -0,0 +1,114 @@
+# benchmark for loading every user, against a local redis
+# usage: python -m bench.users_bench [--users 50000] [--noise 50000] [--chunk 500]
+#
+# fills a group with users (and unrelated keys, like chess boards sharing the
+# db), then reads them all back the previous way (KEYS over the keyspace and
+# one pipeline for everybody) and with CryptoTrader.iterUserChunks (SSCAN of
+# the users set and a pipeline per chunk). reports the total time, the
+# longest single call (redis serves nobody else meanwhile) and the peak
+# python memory while going through the users.
+
+from bot.redis import redis
+from crypto.CryptoTrader import Buy, Condition, CryptoTrader, If, User, writeUser
+from crypto.sources import PriceSource, snapshotOf
+from typing import List
+import argparse
+import random
+import time
+import tracemalloc
+
+GROUP = "bench.users"
+
+
+class NoMarket(PriceSource):
+    def getSnapshot(self):
+        return snapshotOf({}, time.time())
+
+
+def fill(users: int, noise: int) -> None:
+    coins = ["btc", "eth", "xrp", "ltc", "doge", "ada", "dot", "bch"]
+    pipe = redis.pipeline(transaction=False)
+    for u in range(users):
+        user = User(
+            "user{}".format(u),
+            random.uniform(0, 1e5),
+            {c: random.uniform(0, 100) for c in random.sample(coins, 3)},
+            [If(1, Condition("btc", "&gt;", 1e6), Buy(coin="eth", qty="50%"))],
+        )
+        writeUser(pipe, GROUP, user)
+        if u % 1000 == 999:
+            pipe.execute()
+    for n in range(noise):
+        pipe.set("bench.users.noise.{}".format(n), "x")
+        if n % 1000 == 999:
+            pipe.execute()
+    pipe.execute()
+
+
+def clear() -> None:
+    for pattern in ["cryptoTrader.{}.*".format(GROUP), "bench.users.noise.*"]:
+        keys = list(redis.scan_iter(match=pattern, count=1000))
+        for n in range(0, len(keys), 1000):
+            redis.delete(*keys[n : n + 1000])
+
+
+def oldChunks(trader: CryptoTrader, chunk: int, longest: List[float]):
+    # the previous getAllUsers, as a single chunk
+    start = time.perf_counter()
+    prefix = trader._key("user", "")
+    names = [k.decode("utf-8")[len(prefix) :] for k in redis.keys(prefix + "*")]
+    longest[0] = time.perf_counter() - start
+    start = time.perf_counter()
+    users = trader._readUsers(names)
+    longest[0] = max(longest[0], time.perf_counter() - start)
+    yield users
+
+
+def newChunks(trader: CryptoTrader, chunk: int, longest: List[float]):
+    chunks = trader.iterUserChunks(chunk)
+    while True:
+        # a chunk is one SSCAN or more plus one pipeline
+        start = time.perf_counter()
+        users = next(chunks, None)
+        longest[0] = max(longest[0], time.perf_counter() - start)
+        if users is None:
+            return
+        yield users
+
+
+def run(label: str, chunks, trader: CryptoTrader, chunk: int) -> None:
+    longest = [0.0]
+    start = time.perf_counter()
+    n = sum(len(users) for users in chunks(trader, chunk, longest))
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    for users in chunks(trader, chunk, [0.0]):
+        pass
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(
+        "{:<24} {} users in {:6.2f}s, longest call {:7.1f} ms, "
+        "peak {:6.1f} MB".format(label, n, elapsed, longest[0] * 1000, peak / 1e6)
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=50000)
+    parser.add_argument("--noise", type=int, default=50000, help="unrelated keys")
+    parser.add_argument("--chunk", type=int, default=500)
+    args = parser.parse_args()
+
+    clear()
+    fill(args.users, args.noise)
+    trader = CryptoTrader(redis, GROUP, NoMarket())
+    try:
+        run("KEYS + one pipeline", oldChunks, trader, args.chunk)
+        run("SSCAN + chunked", newChunks, trader, args.chunk)
+    finally:
+        clear()
+
+
+if __name__ == "__main__":
+    main()
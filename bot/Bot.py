@@ -1,8 +1,25 @@
 from dataclasses import dataclass
 from typing import Callable, Dict, List, Optional
 from redis import from_url, StrictRedis
-from .config import SLACK_TOKEN
+from .config import SLACK_TOKEN, BOT_WORKERS, BOT_QUEUE_SIZE, BOT_QUEUE_TIMEOUT
+from .backfill import EventLog
+from .dispatch import TriggerIndex
+from .metrics import (
+    commandErrors,
+    commandSeconds,
+    rtmBackfilled,
+    rtmLagSeconds,
+    rtmReconnects,
+    rtmReconnectSeconds,
+    slackApiErrors,
+    slackApiSeconds,
+)
+from .outbound import OutboundQueue
 from .users import getUser
+from .workers import WorkerPool
+from threading import Lock, Thread
+import asyncio
+import random
 import time
 from slackclient import SlackClient
 
@@ -13,17 +30,37 @@ class Bot:
     icon_emoji: str
 
 
+LISTEN_IDLE_SECONDS = 5
+RECONNECT_BASE_SECONDS = 1
+RECONNECT_MAX_SECONDS = 5 * 60
+
+
 class SlackBot(SlackClient):
-    def __init__(self, token: str, bot: Bot, db: StrictRedis) -> None:
+    def __init__(
+        self, token: str, bot: Bot, db: StrictRedis, connect: bool = True
+    ) -> None:
+        # connect=False skips opening an RTM connection, for bots that get
+        # their events from a SlackMux instead
         super().__init__(token)
-        if not self.rtm_connect():
-            raise IOError("Connection to Slack failed, check your token")
         self.bot = bot
+        if connect and not self.rtm_connect():
+            raise IOError("Connection to Slack failed, check your token")
         self.db = db
         self._triggers: Dict = {}
+        self._index = TriggerIndex()
+        self._loop = None
+        self._log = EventLog()
+        self._backfillLock = Lock()
+        self._backfilling = False
+        self._backfillAgain = False
+        self.workers = WorkerPool(
+            bot.name, BOT_WORKERS, BOT_QUEUE_SIZE, BOT_QUEUE_TIMEOUT
+        )
+        self.outbox = OutboundQueue(self)
 
-    def postMessage(self, channel: str, message: str, thread: Optional[str]):
-        self.api_call(
+    def postMessage(self, channel: str, message: str, thread: Optional[str] = None):
+        # queued: sent asynchronously, rate limited and coalesced per channel
+        self.outbox.post(
             "chat.postMessage",
             channel=channel,
             text=message,
@@ -32,60 +69,210 @@ class SlackBot(SlackClient):
             icon_emoji=self.bot.icon_emoji,
         )
 
+    def api_call(self, method, timeout=None, **kwargs):
+        # every Web API call goes through here, so this is where we time them
+        start = time.time()
+        try:
+            result = super().api_call(method, timeout=timeout, **kwargs)
+        except Exception as e:
+            slackApiErrors.inc(self.bot.name, method, type(e).__name__)
+            raise
+        finally:
+            slackApiSeconds.observe(time.time() - start, self.bot.name, method)
+        if not result.get("ok"):
+            slackApiErrors.inc(self.bot.name, method, result.get("error", "unknown"))
+        return result
+
     def register(self, trigger: str, callback, condition):
         # registers a trigger, which fires a callback if condition is true
         maybeCallback = _MaybeCallback(callback, condition)
         self._triggers.setdefault(trigger, [maybeCallback])
+        self._index.add(trigger)
+
+    def matches(self, event) -> bool:
+        # True if a message event starts with one of our triggers
+        return self._index.match(event["text"]) is not None
 
     def notify(self, command):
-        # notifies all subscribers when command triggers, if condition is true
+        # notifies all subscribers when command triggers, if condition is true.
+        # plain callbacks run on the worker pool, in order per user / thread;
+        # coroutine callbacks run on the event loop when listenAsync() is used
         for mc in self._triggers.get(command.trigger, []):
             if mc.condition(command.event):
-                mc.callback(command)
+                if asyncio.iscoroutinefunction(mc.callback) and self._loop:
+                    future = asyncio.run_coroutine_threadsafe(
+                        self._handleAsync(mc.callback, command), self._loop
+                    )
+                    future.add_done_callback(_logHandlerError)
+                elif asyncio.iscoroutinefunction(mc.callback):
+                    coroutine = self._handleAsync(mc.callback, command)
+                    self.workers.submit(_orderingKey(command), asyncio.run, coroutine)
+                else:
+                    self.workers.submit(
+                        _orderingKey(command), self._handle, mc.callback, command
+                    )
+
+    def onEvents(self, events):
+        # turns a batch of rtm events into commands and notifies listeners
+        for command in self._commands(events):
+            self.notify(command)
 
     def listen(self):
         # listens for commands, and process them in turn
         while True:
             try:
-                events = filter(
-                    lambda e: e.get("type") == "message" and "text" in e,
-                    self.rtm_read(),
-                )
-                for event in events:
-                    command = self._messageEventToCommand(event)
-                    if command:
-                        self.notify(command)  # notifies all listeners
+                self.onEvents(self._readAll())
                 time.sleep(0.5)
             except Exception as e:
                 print(e)
                 print("Websocket error. Reconnecting!")
-                self.rtm_connect()
+                self._reconnect()
+
+    def listenAsync(self):
+        # event loop mode: wakes up as soon as a websocket frame arrives
+        # instead of polling rtm_read() every 0.5s. coroutine callbacks are
+        # awaited on the loop, plain callbacks run on the worker pool.
+        # listen() is still available as the blocking fallback.
+        asyncio.run(self._listenAsync())
+
+    async def _listenAsync(self):
+        loop = self._loop = asyncio.get_event_loop()
+        while True:
+            fd = None
+            try:
+                fd = self.server.websocket.sock.fileno()
+                ready = asyncio.Event()
+                loop.add_reader(fd, ready.set)
+                while True:
+                    try:
+                        # the timeout is a safety net for frames that were
+                        # already buffered by the TLS layer when we last read
+                        await asyncio.wait_for(ready.wait(), LISTEN_IDLE_SECONDS)
+                    except asyncio.TimeoutError:
+                        pass
+                    ready.clear()
+                    self.onEvents(self._readAll())
+            except Exception as e:
+                print(e)
+                print("Websocket error. Reconnecting!")
+                await loop.run_in_executor(None, self._reconnect)
+            finally:
+                if fd is not None:
+                    loop.remove_reader(fd)
+
+    def _readAll(self):
+        # rtm_read() returns at most one websocket frame per call, so keep
+        # reading until nothing is buffered
+        events = []
+        while True:
+            batch = self.rtm_read()
+            if not batch:
+                return self._log.fresh(events)
+            events.extend(batch)
+
+    def _reconnect(self):
+        # retries with jittered exponential backoff, so a degraded Slack
+        # isn't hammered, then replays what was sent while we were away in
+        # the background, so listening resumes right away
+        start = time.time()
+        attempt = 0
+        while True:
+            try:
+                if self.rtm_connect():
+                    break
+            except Exception as e:
+                print(e)
+            delay = min(RECONNECT_MAX_SECONDS, RECONNECT_BASE_SECONDS * 2**attempt)
+            attempt += 1
+            time.sleep(random.uniform(delay / 2, delay))
+        rtmReconnects.inc(self.bot.name)
+        rtmReconnectSeconds.observe(time.time() - start, self.bot.name)
+        print("Reconnected after {n} retries".format(n=attempt))
+        self._backfillInBackground()
+
+    def _backfillInBackground(self):
+        # one backfill at a time; a reconnect during one runs another after
+        with self._backfillLock:
+            self._backfillAgain = True
+            if self._backfilling:
+                return
+            self._backfilling = True
+        Thread(target=self._backfill, daemon=True).start()
+
+    def _backfill(self):
+        while True:
+            with self._backfillLock:
+                if not self._backfillAgain:
+                    self._backfilling = False
+                    return
+                self._backfillAgain = False
+            try:
+                missed = self._log.missed(self)
+            except Exception as e:
+                print("Backfill failed: {e}".format(e=e))
+                continue
+            if missed:
+                print("Backfilling {n} missed messages".format(n=len(missed)))
+                rtmBackfilled.inc(self.bot.name, amount=len(missed))
+                self.onEvents(missed)
+
+    def serve(self, queue):
+        # handles event batches forwarded by a SlackMux, see bot/mux.py
+        while True:
+            self.onEvents(queue.get())
+
+    def _handle(self, callback, command):
+        start = time.time()
+        try:
+            callback(command)
+        except Exception:
+            commandErrors.inc(self.bot.name, command.trigger)
+            raise
+        finally:
+            commandSeconds.observe(time.time() - start, self.bot.name, command.trigger)
+
+    async def _handleAsync(self, callback, command):
+        start = time.time()
+        try:
+            await callback(command)
+        except Exception:
+            commandErrors.inc(self.bot.name, command.trigger)
+            raise
+        finally:
+            commandSeconds.observe(time.time() - start, self.bot.name, command.trigger)
+
+    def _commands(self, events):
+        # yields the commands in a batch of rtm events
+        for event in events:
+            if event.get("type") == "message" and "text" in event:
+                if event.get("ts"):
+                    lag = time.time() - float(event["ts"])
+                    rtmLagSeconds.observe(lag, self.bot.name)
+                command = self._messageEventToCommand(event)
+                if command:
+                    yield command
 
     def _messageEventToCommand(self, event):
-        for trigger in self._triggers.keys():
-            if event["text"].lower().startswith(trigger.lower()):
-                cmdText = event["text"].strip()
-                argText = cmdText[len(trigger) :].strip()
-                # crypto commands are downcased for convenience
-                if cmdText.startswith("crypto"):
-                    args = argText.lower().split()
-                else:
-                    args = argText.split()
-                return Command(
-                    trigger,
-                    args,
-                    Event(
-                        event.get("type"),
-                        event.get("subtype"),
-                        event.get("channel"),
-                        event.get("user"),
-                        event.get("text"),
-                        event.get("ts"),
-                        event.get("thread_ts"),
-                    ),
-                )
-
-        return None
+        match = self._index.match(event["text"])
+        if match is None:
+            return None
+        trigger, args = match
+        # crypto commands are downcased for convenience
+        if event["text"].strip().startswith("crypto"):
+            args = [arg.lower() for arg in args]
+        return Command(
+            trigger,
+            args,
+            Event(
+                event.get("type"),
+                event.get("subtype"),
+                event.get("channel"),
+                event.get("user"),
+                event.get("text"),
+                event.get("ts"),
+                event.get("thread_ts"),
+            ),
+        )
 
 
 @dataclass
@@ -137,6 +324,19 @@ def allMessageEvents(event):
     return event.type == "message" and event.subtype is None and event.text is not None
 
 
+def _orderingKey(command):
+    # commands in the same thread (e.g. one chess game) or from the same user
+    # must be handled in the order they were sent
+    if command.thread is not None:
+        return (command.channel, command.thread)
+    return command.event.user_id
+
+
+def _logHandlerError(future):
+    if not future.cancelled() and future.exception() is not None:
+        print("Handler error: {e}".format(e=future.exception()))
+
+
 class _MaybeCallback(object):
     def __init__(self, callback, condition):
         self.callback = callback
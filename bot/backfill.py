@@ -0,0 +1,128 @@
+from collections import OrderedDict, deque
+from threading import Lock
+from typing import Deque, Dict, List, Optional, Set, Tuple
+import time
+
+# threads we remember the last message of, oldest are forgotten first
+MAX_TRACKED = 200
+# after a reconnect every channel is backfilled, but only the threads with
+# a message this recent, at most this many of them, newest first: each one
+# is a conversations.replies call, which slack rate limits
+BACKFILL_THREAD_SECONDS = 15 * 60
+MAX_BACKFILL_THREADS = 10
+# (channel, ts) pairs remembered to drop duplicates after a reconnect
+MAX_SEEN = 2000
+PAGE_SIZE = 200
+RATELIMIT_RETRIES = 3
+DEFAULT_RETRY_AFTER = 1.0
+
+
+class EventLog:
+    # remembers the newest message ts seen per channel and per thread, so
+    # that after a reconnect the messages sent while we were away can be
+    # fetched with conversations.history / conversations.replies.
+    # also drops messages that were already handled, since the RTM stream
+    # and the backfill can overlap. the backfill runs on its own thread while
+    # the listener keeps going, hence the lock.
+
+    def __init__(self) -> None:
+        self._last: Dict[Tuple[str, Optional[str]], str] = OrderedDict()
+        self._seen: Set[Tuple[str, str]] = set()
+        self._order: Deque[Tuple[str, str]] = deque()
+        self._lock = Lock()
+
+    def fresh(self, events: List[Dict]) -> List[Dict]:
+        # records message events and returns the ones not seen before
+        with self._lock:
+            return self._fresh(events)
+
+    def _fresh(self, events: List[Dict]) -> List[Dict]:
+        fresh = []
+        for event in events:
+            channel, ts = event.get("channel"), event.get("ts")
+            if event.get("type") != "message" or not channel or not ts:
+                fresh.append(event)
+                continue
+            if (channel, ts) in self._seen:
+                continue
+            self._remember(channel, ts)
+            self._advance((channel, None), ts)
+            if event.get("thread_ts"):
+                self._advance((channel, event["thread_ts"]), ts)
+            fresh.append(event)
+        return fresh
+
+    def missed(self, client) -> List[Dict]:
+        # every message newer than the last one we saw, oldest first
+        messages = []
+        for (channel, thread), oldest in self._backfilled():
+            if thread is None:
+                found = _page(client, "conversations.history", channel, oldest)
+            else:
+                found = _page(
+                    client, "conversations.replies", channel, oldest, ts=thread
+                )
+            for message in found:
+                if float(message.get("ts", 0)) > float(oldest):
+                    message.setdefault("type", "message")
+                    message["channel"] = channel
+                    messages.append(message)
+        messages.sort(key=lambda m: float(m["ts"]))
+        return self.fresh(messages)
+
+    def _backfilled(self) -> List[Tuple[Tuple[str, Optional[str]], str]]:
+        # every channel, and the threads that were recently active
+        with self._lock:
+            last = list(self._last.items())
+        channels = [(key, ts) for key, ts in last if key[1] is None]
+        since = time.time() - BACKFILL_THREAD_SECONDS
+        threads = [(key, ts) for key, ts in last if key[1] and float(ts) > since]
+        threads.sort(key=lambda item: -float(item[1]))
+        return channels + threads[:MAX_BACKFILL_THREADS]
+
+    def _advance(self, key: Tuple[str, Optional[str]], ts: str) -> None:
+        if float(ts) > float(self._last.get(key, 0)):
+            self._last[key] = ts
+        self._last.move_to_end(key)  # type: ignore
+        while len(self._last) > MAX_TRACKED:
+            self._last.popitem(last=False)  # type: ignore
+
+    def _remember(self, channel: str, ts: str) -> None:
+        self._seen.add((channel, ts))
+        self._order.append((channel, ts))
+        while len(self._order) > MAX_SEEN:
+            self._seen.discard(self._order.popleft())
+
+
+def _page(client, method: str, channel: str, oldest: str, **kwargs) -> List[Dict]:
+    messages: List[Dict] = []
+    cursor = None
+    retries = 0
+    while True:
+        resp = client.api_call(
+            method,
+            channel=channel,
+            oldest=oldest,
+            limit=PAGE_SIZE,
+            cursor=cursor,
+            **kwargs
+        )
+        if resp.get("error") == "ratelimited" and retries < RATELIMIT_RETRIES:
+            # wait as long as slack asked, then ask for the same page again
+            retries += 1
+            retryAfter = float(
+                resp.get("headers", {}).get("Retry-After", DEFAULT_RETRY_AFTER)
+            )
+            time.sleep(retryAfter)
+            continue
+        if not resp.get("ok"):
+            print(
+                "{method} failed for {channel}: {e}".format(
+                    method=method, channel=channel, e=resp.get("error")
+                )
+            )
+            return messages
+        messages.extend(resp.get("messages", []))
+        cursor = resp.get("response_metadata", {}).get("next_cursor")
+        if not resp.get("has_more") or not cursor:
+            return messages
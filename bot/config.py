@@ -7,3 +7,12 @@ REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
 REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
 REDIS_DB = int(os.getenv("REDIS_DB", 0))
 REDIS_PASSWORD = os.getenv("REDIS_PASSWORD")
+
+# command handlers run on a pool of worker threads, see bot/workers.py
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", 4))
+BOT_QUEUE_SIZE = int(os.getenv("BOT_QUEUE_SIZE", 100))
+BOT_QUEUE_TIMEOUT = float(os.getenv("BOT_QUEUE_TIMEOUT", 0.5))
+
+# "async" reads the RTM websocket from an event loop (SlackBot.listenAsync),
+# "poll" falls back to the blocking rtm_read() loop (SlackBot.listen)
+BOT_LISTENER = os.getenv("BOT_LISTENER", "async")
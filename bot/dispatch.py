@@ -0,0 +1,50 @@
+from typing import Dict, List, Optional, Tuple
+
+
+class TriggerIndex:
+    # token trie over registered triggers, built at register() time.
+    # a message is matched against the longest registered trigger that is
+    # a whitespace-token prefix of it, so "crypto prices" never shadows
+    # "crypto price" (or vice versa) regardless of registration order.
+    # messages whose first token starts no trigger are rejected after a
+    # single dict lookup.
+
+    def __init__(self) -> None:
+        self._root = _Node()
+
+    def add(self, trigger: str) -> None:
+        node = self._root
+        for token in trigger.lower().split():
+            node = node.children.setdefault(token, _Node())
+        node.trigger = trigger
+
+    def match(self, text: str) -> Optional[Tuple[str, List[str]]]:
+        # returns (trigger, remaining tokens), or None if nothing matches
+        head = text.split(None, 1)
+        if not head:
+            return None
+        node = self._root.children.get(head[0].lower())
+        if node is None:
+            return None
+
+        tokens = text.split()
+        found: Optional[str] = node.trigger
+        consumed = 1
+        for i in range(1, len(tokens)):
+            node = node.children.get(tokens[i].lower())
+            if node is None:
+                break
+            if node.trigger is not None:
+                found, consumed = node.trigger, i + 1
+
+        if found is None:
+            return None
+        return found, tokens[consumed:]
+
+
+class _Node:
+    __slots__ = ("children", "trigger")
+
+    def __init__(self) -> None:
+        self.children: Dict[str, "_Node"] = {}
+        self.trigger: Optional[str] = None
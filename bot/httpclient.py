@@ -0,0 +1,112 @@
+from .metrics import httpErrors, httpRetries, httpSeconds
+from requests import RequestException, Response, Session
+from requests.adapters import HTTPAdapter
+from threading import Lock
+from typing import Dict, Optional, Tuple, Union
+from urllib.parse import urlsplit
+import os
+import time
+
+CONNECT_TIMEOUT = 3.05
+READ_TIMEOUT = 15.0
+MAX_RETRIES = 2
+RETRY_BACKOFF_SECONDS = 0.2
+# every request earns RETRY_BUDGET_RATIO retries, up to RETRY_BUDGET_MAX saved,
+# so a host that is down doesn't get every call multiplied by MAX_RETRIES
+RETRY_BUDGET_RATIO = 0.2
+RETRY_BUDGET_MAX = 10.0
+POOL_SIZE = 10
+
+IDEMPOTENT = frozenset(["GET", "HEAD", "OPTIONS", "PUT", "DELETE"])
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+Timeout = Union[float, Tuple[float, float]]
+
+
+class HttpClient:
+    # one keep-alive requests.Session per host, so repeated calls to
+    # CoinMarketCap, is.gd or lichess reuse their TCP+TLS connection.
+    # every call gets connect and read timeouts, idempotent calls are retried
+    # on connection errors and 5xx / 429 while the host's retry budget lasts,
+    # and latency is recorded per host.
+
+    def __init__(
+        self,
+        timeout: Timeout = (CONNECT_TIMEOUT, READ_TIMEOUT),
+        retries: int = MAX_RETRIES,
+    ) -> None:
+        self.timeout = timeout
+        self.retries = retries
+        self._sessions: Dict[str, Session] = {}
+        self._budgets: Dict[str, float] = {}
+        self._lock = Lock()
+        self._pid = None
+
+    def get(self, url: str, **kwargs) -> Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> Response:
+        return self.request("POST", url, **kwargs)
+
+    def request(
+        self, method: str, url: str, timeout: Optional[Timeout] = None, **kwargs
+    ) -> Response:
+        method = method.upper()
+        host = urlsplit(url).netloc
+        session = self._session(host)
+        self._earn(host)
+        attempt = 0
+        while True:
+            start = time.time()
+            try:
+                resp = session.request(
+                    method, url, timeout=timeout or self.timeout, **kwargs
+                )
+            except RequestException as e:
+                httpErrors.inc(host, type(e).__name__)
+                if not self._mayRetry(method, host, attempt):
+                    raise
+            else:
+                httpSeconds.observe(time.time() - start, host, method)
+                if resp.status_code >= 400:
+                    httpErrors.inc(host, str(resp.status_code))
+                if resp.status_code not in RETRY_STATUSES or not self._mayRetry(
+                    method, host, attempt
+                ):
+                    return resp
+            attempt += 1
+            httpRetries.inc(host)
+            time.sleep(RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1))
+
+    def _session(self, host: str) -> Session:
+        with self._lock:
+            if self._pid != os.getpid():
+                # pooled sockets must not be shared with a forked parent
+                self._sessions = {}
+                self._pid = os.getpid()
+            if host not in self._sessions:
+                session = Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.headers["Accept-Encoding"] = "gzip, deflate"
+                self._sessions[host] = session
+            return self._sessions[host]
+
+    def _earn(self, host: str) -> None:
+        with self._lock:
+            self._budgets[host] = min(
+                RETRY_BUDGET_MAX, self._budgets.get(host, 1.0) + RETRY_BUDGET_RATIO
+            )
+
+    def _mayRetry(self, method: str, host: str, attempt: int) -> bool:
+        if method not in IDEMPOTENT or attempt >= self.retries:
+            return False
+        with self._lock:
+            if self._budgets.get(host, 0) < 1:
+                return False
+            self._budgets[host] -= 1
+            return True
+
+
+http = HttpClient()
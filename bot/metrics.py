@@ -0,0 +1,216 @@
+from .redis import redis
+from collections import defaultdict
+from threading import Lock, Thread
+from typing import Dict, List, Sequence, Tuple
+import os
+import time
+
+# every process buffers its observations and adds them to one redis hash, so
+# the /metrics endpoint shows the sum over all bot processes
+METRICS_KEY = "pybot.metrics"
+FLUSH_SECONDS = 5
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class _Registry:
+    def __init__(self) -> None:
+        self.metrics: Dict[str, "_Metric"] = {}
+        self._pending: Dict[str, float] = defaultdict(float)
+        self._gauges: Dict[str, float] = {}
+        self._lock = Lock()
+        self._pid = None
+
+    def add(self, field: str, amount: float) -> None:
+        self._ensureStarted()
+        with self._lock:
+            self._pending[field] += amount
+
+    def set(self, field: str, value: float) -> None:
+        self._ensureStarted()
+        with self._lock:
+            self._gauges[field] = value
+
+    def flush(self) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(float)
+            gauges, self._gauges = self._gauges, {}
+        if not pending and not gauges:
+            return
+        pipe = redis.pipeline(transaction=False)
+        for field, amount in pending.items():
+            pipe.hincrbyfloat(METRICS_KEY, field, amount)
+        if gauges:
+            pipe.hmset(METRICS_KEY, gauges)
+        pipe.execute()
+
+    def _ensureStarted(self) -> None:
+        # threads don't survive a fork, so start the flusher in whichever
+        # process first records something
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pending.clear()
+            self._gauges.clear()
+            self._pid = os.getpid()
+        Thread(target=self._flushForever, daemon=True).start()
+
+    def _flushForever(self) -> None:
+        while True:
+            time.sleep(FLUSH_SECONDS)
+            try:
+                self.flush()
+            except Exception as e:
+                print("metrics flush failed: {e}".format(e=e))
+
+
+_registry = _Registry()
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str]) -> None:
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        _registry.metrics[name] = self
+
+    def _labelStr(self, values: Sequence[str], extra: str = "") -> str:
+        pairs = [
+            '{k}="{v}"'.format(k=k, v=_escape(str(v)))
+            for k, v in zip(self.labels, values)
+        ]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        _registry.add(self.name + self._labelStr(labels), amount)
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def set(self, value: float, *labels: str) -> None:
+        _registry.set(self.name + self._labelStr(labels), value)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str],
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels: str) -> None:
+        for le in self.buckets:
+            if value <= le:
+                field = self._labelStr(labels, 'le="{le}"'.format(le=le))
+                _registry.add(self.name + "_bucket" + field, 1)
+        _registry.add(self.name + "_bucket" + self._labelStr(labels, 'le="+Inf"'), 1)
+        _registry.add(self.name + "_sum" + self._labelStr(labels), value)
+        _registry.add(self.name + "_count" + self._labelStr(labels), 1)
+
+
+def render() -> str:
+    # prometheus text exposition format, summed over all processes
+    samples: Dict[str, List[Tuple[str, str]]] = defaultdict(list)
+    for field, value in redis.hgetall(METRICS_KEY).items():
+        field = field.decode()
+        name = field.split("{")[0]
+        for suffix in ("_bucket", "_sum", "_count"):
+            base = name[: -len(suffix)]
+            if name.endswith(suffix) and isinstance(
+                _registry.metrics.get(base), Histogram
+            ):
+                name = base
+        samples[name].append((field, _number(value.decode())))
+
+    lines = []
+    for name in sorted(samples.keys()):
+        metric = _registry.metrics.get(name)
+        if metric:
+            lines.append("# HELP {n} {h}".format(n=name, h=metric.help))
+            lines.append("# TYPE {n} {t}".format(n=name, t=metric.type))
+        for field, value in sorted(samples[name]):
+            lines.append("{f} {v}".format(f=field, v=value))
+    return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value: str) -> str:
+    f = float(value)
+    return str(int(f)) if f.is_integer() else repr(f)
+
+
+# -- metrics shared by all bots -- #
+
+commandSeconds = Histogram(
+    "pybot_command_seconds", "Command handler latency.", ["bot", "trigger"]
+)
+commandErrors = Counter(
+    "pybot_command_errors_total", "Command handlers that raised.", ["bot", "trigger"]
+)
+rtmLagSeconds = Histogram(
+    "pybot_rtm_lag_seconds",
+    "Delay between a message being sent and read off the RTM socket.",
+    ["bot"],
+)
+rtmReconnects = Counter("pybot_rtm_reconnects_total", "RTM reconnects.", ["bot"])
+rtmReconnectSeconds = Histogram(
+    "pybot_rtm_reconnect_seconds",
+    "Time from losing the RTM connection to getting it back.",
+    ["bot"],
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800),
+)
+rtmBackfilled = Counter(
+    "pybot_rtm_backfilled_total",
+    "Messages fetched from history after a reconnect.",
+    ["bot"],
+)
+slackApiSeconds = Histogram(
+    "pybot_slack_api_seconds", "Slack Web API call latency.", ["bot", "method"]
+)
+slackApiErrors = Counter(
+    "pybot_slack_api_errors_total",
+    "Slack Web API calls that failed or returned ok=false.",
+    ["bot", "method", "error"],
+)
+workerJobs = Counter(
+    "pybot_worker_jobs_total", "Jobs handled by the worker pool.", ["pool", "result"]
+)
+workerQueueDepth = Gauge(
+    "pybot_worker_queue_depth", "Jobs waiting in the worker pool.", ["pool"]
+)
+cacheRequests = Counter(
+    "pybot_cache_requests_total",
+    "CachedGet lookups: hit, miss, stale or coalesced.",
+    ["result"],
+)
+httpSeconds = Histogram(
+    "pybot_http_seconds", "Outbound HTTP request latency.", ["host", "method"]
+)
+httpErrors = Counter(
+    "pybot_http_errors_total",
+    "Outbound HTTP requests that failed or returned a 4xx / 5xx status.",
+    ["host", "error"],
+)
+httpRetries = Counter(
+    "pybot_http_retries_total", "Outbound HTTP requests retried.", ["host"]
+)
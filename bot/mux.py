@@ -0,0 +1,32 @@
+from .Bot import Bot, SlackBot
+from typing import List, Optional, Tuple
+
+
+class SlackMux(SlackBot):
+    # a single RTM connection shared by many bots.
+    # events are read and decoded once, non-messages are dropped once, and
+    # each bot only receives the messages that match one of its triggers:
+    # either directly (in-process) or through a queue read by bot.serve() in
+    # a worker process. bots routed through a mux are created with
+    # connect=False, so they don't hold a websocket of their own.
+
+    def __init__(self, token: str, connect: bool = True) -> None:
+        super().__init__(token, Bot("mux", ":satellite_antenna:"), None, connect)
+        self._routes: List[Tuple[SlackBot, Optional[object]]] = []
+
+    def route(self, bot: SlackBot, queue=None) -> None:
+        # queue is anything with put(), e.g. a multiprocessing.Queue
+        self._routes.append((bot, queue))
+
+    def onEvents(self, events):
+        messages = [e for e in events if e.get("type") == "message" and "text" in e]
+        if not messages:
+            return
+        for bot, queue in self._routes:
+            mine = [e for e in messages if bot.matches(e)]
+            if not mine:
+                continue
+            if queue is None:
+                bot.onEvents(mine)
+            else:
+                queue.put(mine)
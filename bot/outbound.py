@@ -0,0 +1,174 @@
+from collections import OrderedDict, deque
+from threading import Condition, Thread
+from typing import Deque, Dict, List, Optional, Tuple
+import os
+import time
+
+# Slack allows roughly one message per second per channel, with short bursts
+CHANNEL_RATE = 1.0
+CHANNEL_BURST = 4
+METHOD_RATE = 20.0
+METHOD_BURST = 20
+DEFAULT_RETRY_AFTER = 1.0
+MAX_COALESCED_CHARS = 3500
+
+
+class OutboundQueue:
+    # fire-and-forget queue for outbound Slack Web API calls.
+    # calls are sent from a background thread, so handlers return right away.
+    # every (method, channel) pair and every method has its own token bucket,
+    # consecutive chat.postMessage calls to the same channel / thread are
+    # coalesced into a single post, and a ratelimited response pauses that
+    # channel for the Retry-After the API asked for.
+
+    def __init__(self, client) -> None:
+        self.client = client
+        self._pending: Dict[Tuple[str, str], Deque[Dict]] = OrderedDict()
+        self._buckets: Dict[object, _TokenBucket] = {}
+        self._cv = Condition()
+        self._inflight: List[Tuple[str, str]] = []  # keys being sent
+        self._pid = None
+
+    def post(self, method: str, **kwargs) -> None:
+        self._ensureStarted()
+        with self._cv:
+            key = (method, kwargs.get("channel"))
+            self._pending.setdefault(key, deque()).append(kwargs)
+            self._cv.notify()
+
+    def flush(self, channel: Optional[str] = None, timeout: float = 10.0) -> bool:
+        # blocks until everything queued so far (to channel, if given) has
+        # been sent
+        deadline = time.time() + timeout
+        with self._cv:
+            while self._busy(channel):
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self._cv.wait(remaining)
+        return True
+
+    def _busy(self, channel: Optional[str]) -> bool:
+        if channel is None:
+            return bool(self._pending or self._inflight)
+        return any(key[1] == channel for key in [*self._pending, *self._inflight])
+
+    def _ensureStarted(self) -> None:
+        # threads don't survive a fork, so start the sender in whichever
+        # process first posts something
+        with self._cv:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        Thread(target=self._send, daemon=True).start()
+
+    def _send(self) -> None:
+        while True:
+            with self._cv:
+                key, kwargs = self._next()
+                while key is None:
+                    self._cv.wait(kwargs)
+                    key, kwargs = self._next()
+                self._inflight.append(key)
+
+            method, channel = key
+            try:
+                result = self.client.api_call(method, **kwargs)
+            except Exception as e:
+                print("Outbound {method} failed: {e}".format(method=method, e=e))
+                result = {}
+
+            with self._cv:
+                self._inflight.remove(key)
+                if result.get("error") == "ratelimited":
+                    retryAfter = float(
+                        result.get("headers", {}).get(
+                            "Retry-After", DEFAULT_RETRY_AFTER
+                        )
+                    )
+                    print(
+                        "Rate limited on {method} {channel}, retrying in {s}s".format(
+                            method=method, channel=channel, s=retryAfter
+                        )
+                    )
+                    self._bucket(key).pause(retryAfter)
+                    self._pending.setdefault(key, deque()).appendleft(kwargs)
+                    self._pending.move_to_end(key, last=False)
+                self._cv.notify_all()
+
+    def _next(self):
+        # returns (key, kwargs) for the next call that may be sent now, or
+        # (None, seconds to wait) if every pending channel is rate limited
+        now = time.time()
+        wait = None
+        for key in list(self._pending.keys()):
+            delay = max(self._bucket(key).delay(now), self._bucket(key[0]).delay(now))
+            if delay > 0:
+                wait = delay if wait is None else min(wait, delay)
+                continue
+            self._bucket(key).take()
+            self._bucket(key[0]).take()
+            queue = self._pending.pop(key)
+            kwargs = _coalesce(key[0], queue)
+            if queue:
+                # round robin: this channel goes to the back of the line
+                self._pending[key] = queue
+            return key, kwargs
+        return None, wait
+
+    def _bucket(self, key) -> "_TokenBucket":
+        if key not in self._buckets:
+            if isinstance(key, tuple):
+                self._buckets[key] = _TokenBucket(CHANNEL_RATE, CHANNEL_BURST)
+            else:
+                self._buckets[key] = _TokenBucket(METHOD_RATE, METHOD_BURST)
+        return self._buckets[key]
+
+
+def _coalesce(method: str, queue: Deque[Dict]) -> Dict:
+    # merges consecutive chat.postMessage calls that only differ in text
+    kwargs = queue.popleft()
+    if method != "chat.postMessage" or "text" not in kwargs:
+        return kwargs
+    texts = [kwargs["text"]]
+    size = len(kwargs["text"])
+    while queue and _sameTarget(kwargs, queue[0]):
+        text = queue[0]["text"]
+        if size + len(text) > MAX_COALESCED_CHARS:
+            break
+        texts.append(text)
+        size += len(text)
+        queue.popleft()
+    return dict(kwargs, text="\n".join(texts))
+
+
+def _sameTarget(a: Dict, b: Dict) -> bool:
+    return "text" in b and {k: v for k, v in a.items() if k != "text"} == {
+        k: v for k, v in b.items() if k != "text"
+    }
+
+
+class _TokenBucket:
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.time()
+        self.pausedUntil = 0.0
+
+    def delay(self, now: float) -> float:
+        # seconds until a token is available
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if now < self.pausedUntil:
+            return self.pausedUntil - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+    def pause(self, seconds: float) -> None:
+        self.pausedUntil = time.time() + seconds
+        self.tokens = 0.0
@@ -1,15 +1,123 @@
 from .config import SLACK_TOKEN
+from .redis import redis
+from redis import StrictRedis
 from slackclient import SlackClient
-from typing import Dict
+from threading import Lock, Thread
+from typing import Dict, Optional
+import json
+import time
 
 slack = SlackClient(SLACK_TOKEN)
 
-_USER_CACHE: Dict[str, object] = {}
+USERS_KEY = "slack.users"
+USERS_LOCK_KEY = "slack.users.lock"
+USERS_TTL_SECONDS = 24 * 60 * 60
+REFRESH_SECONDS = 60 * 60
+PAGE_SIZE = 200
+
+# the fields we keep per user, the rest of users.list is a lot of profile data
+_USER_FIELDS = ("id", "name", "real_name", "tz", "is_bot", "deleted")
+
+
+class UserDirectory:
+    # userId -> user mappings, bulk loaded with users.list and shared between
+    # processes through a redis hash, so commands don't wait on users.info.
+    # after REFRESH_SECONDS the directory reloads itself in the background;
+    # a redis lock makes sure only one process pages through users.list.
+
+    def __init__(self, client: SlackClient, db: StrictRedis) -> None:
+        self.client = client
+        self.db = db
+        self._users: Dict[str, Dict] = {}
+        self._loadedAt = 0.0
+        self._refreshing = Lock()
+
+    def get(self, user_id: str) -> Dict:
+        self._maybeRefresh()
+        user = self._users.get(user_id)
+        if user is None:
+            user = self._fromRedis(user_id)
+        if user is None:
+            # joined since the last bulk load
+            user = _trim(self.client.api_call("users.info", user=user_id)["user"])
+            self._store({user_id: user})
+        return user
+
+    def warm(self) -> None:
+        # prefetch at startup, reusing what another process already loaded
+        if not self._loadFromRedis():
+            self.load()
+
+    def load(self) -> None:
+        users: Dict[str, Dict] = {}
+        cursor = None
+        while True:
+            resp = self.client.api_call("users.list", limit=PAGE_SIZE, cursor=cursor)
+            if resp.get("error") == "ratelimited":
+                time.sleep(float(resp.get("headers", {}).get("Retry-After", 1)))
+                continue
+            if not resp.get("ok"):
+                print("users.list failed: {e}".format(e=resp.get("error")))
+                break
+            for member in resp["members"]:
+                users[member["id"]] = _trim(member)
+            cursor = resp.get("response_metadata", {}).get("next_cursor")
+            if not cursor:
+                break
+        if users:
+            self._store(users)
+        self._loadedAt = time.time()
+        print("loaded {n} slack users".format(n=len(users)))
+
+    def _maybeRefresh(self) -> None:
+        if time.time() - self._loadedAt < REFRESH_SECONDS:
+            return
+        if self._refreshing.acquire(blocking=False):
+            Thread(target=self._refresh, daemon=True).start()
+
+    def _refresh(self) -> None:
+        try:
+            if self.db.set(USERS_LOCK_KEY, 1, ex=REFRESH_SECONDS, nx=True):
+                self.load()
+            else:
+                self._loadFromRedis()
+        except Exception as e:
+            print("user directory refresh failed: {e}".format(e=e))
+        finally:
+            self._refreshing.release()
+
+    def _loadFromRedis(self) -> bool:
+        cached = self.db.hgetall(USERS_KEY)
+        if not cached:
+            return False
+        self._users.update(
+            {k.decode(): json.loads(v.decode()) for k, v in cached.items()}
+        )
+        self._loadedAt = time.time()
+        return True
+
+    def _fromRedis(self, user_id: str) -> Optional[Dict]:
+        cached = self.db.hget(USERS_KEY, user_id)
+        if cached is None:
+            return None
+        user = json.loads(cached.decode())
+        self._users[user_id] = user
+        return user
+
+    def _store(self, users: Dict[str, Dict]) -> None:
+        self._users.update(users)
+        pipe = self.db.pipeline()
+        pipe.hmset(USERS_KEY, {k: json.dumps(v) for k, v in users.items()})
+        pipe.expire(USERS_KEY, USERS_TTL_SECONDS)
+        pipe.execute()
+
+
+def _trim(user: Dict) -> Dict:
+    return {k: user[k] for k in _USER_FIELDS if k in user}
+
+
+directory = UserDirectory(slack, redis)
 
 
 def getUser(user_id):
-    # store a cache of userId -> userName mappings,
-    # so we don't need to make API calls every time
-    if not _USER_CACHE.get(user_id):
-        _USER_CACHE[user_id] = slack.api_call("users.info", user=user_id)["user"]
-    return _USER_CACHE[user_id]
+    return directory.get(user_id)
@@ -0,0 +1,89 @@
+from .metrics import workerJobs, workerQueueDepth
+from queue import Full, Queue
+from threading import Lock, Thread
+from typing import Callable, Dict, Hashable, List
+import os
+
+
+class WorkerPool:
+    # runs submitted jobs on a fixed set of worker threads.
+    # every key is pinned to a single worker, so jobs that share a key
+    # (the same user, the same chess thread) run in the order they were
+    # submitted, while jobs for other keys run concurrently.
+    # each worker has a bounded queue; when it is full, submit() waits up to
+    # `timeout` seconds and then rejects the job.
+
+    def __init__(
+        self, name: str, workers: int, queue_size: int, timeout: float
+    ) -> None:
+        self.name = name
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._queues: List[Queue] = []
+        self._pid = None
+        self._lock = Lock()
+        self._stats = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "rejected": 0,
+            "max_queued": 0,
+        }
+
+    def submit(self, key: Hashable, fn: Callable, *args) -> bool:
+        # returns False if the job was rejected because the pool is saturated
+        if self.workers <= 0:
+            self._run(fn, args)
+            return True
+
+        self._ensureStarted()
+        queue = self._queues[hash(key) % self.workers]
+        try:
+            queue.put((fn, args), timeout=self.timeout)
+        except Full:
+            self._count("rejected")
+            print("Worker queue full, rejected job for {key}".format(key=key))
+            return False
+        self._count("submitted")
+        with self._lock:
+            self._stats["max_queued"] = max(self._stats["max_queued"], queue.qsize())
+        workerQueueDepth.set(sum(q.qsize() for q in self._queues), self.name)
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["queued"] = sum(q.qsize() for q in self._queues)
+        return stats
+
+    def _ensureStarted(self) -> None:
+        # threads don't survive a fork, so (re)start them lazily in whichever
+        # process first submits a job
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queues = [Queue(self.queue_size) for _ in range(self.workers)]
+            for queue in self._queues:
+                Thread(target=self._work, args=(queue,), daemon=True).start()
+            self._pid = os.getpid()
+
+    def _work(self, queue: Queue) -> None:
+        while True:
+            fn, args = queue.get()
+            self._run(fn, args)
+
+    def _run(self, fn: Callable, args) -> None:
+        try:
+            fn(*args)
+            self._count("completed")
+        except Exception as e:
+            self._count("failed")
+            print("Handler error: {e}".format(e=e))
+
+    def _count(self, stat: str) -> None:
+        with self._lock:
+            self._stats[stat] += 1
+        workerJobs.inc(self.name, stat)
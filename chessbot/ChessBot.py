@@ -13,8 +13,8 @@ MP = "chess"
 
 
 class ChessBot(SlackBot):
-    def __init__(self, token, bot, db):
-        super().__init__(token, bot, db)
+    def __init__(self, token, bot, db, connect=True):
+        super().__init__(token, bot, db, connect)
         self.STARTUP_STATE = {}
 
     def onStart(self, cmd: Command):
@@ -1,12 +1,10 @@
-import requests
+from bot.httpclient import http
 
 
 def upload_analysis(pgn_string):
     """Uploads a PGN to lichess.org and returns the URL
     to view the analysis."""
 
-    r = requests.post(
-        "http://en.lichess.org/import", data={"pgn": pgn_string}, timeout=15
-    )
+    r = http.post("http://en.lichess.org/import", data={"pgn": pgn_string})
     r.raise_for_status()
     return r.request.url
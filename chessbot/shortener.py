@@ -1,11 +1,20 @@
 import urllib.parse
 
-import requests
+from bot.httpclient import http
+from requests import RequestException
 
 
 def shorten_url(url):
-    r = requests.get(
-        "http://is.gd/create.php?format=simple&url={}".format(urllib.parse.quote(url))
-    )
-    r.raise_for_status()
+    try:
+        r = http.get(
+            "http://is.gd/create.php?format=simple&url={}".format(
+                urllib.parse.quote(url)
+            ),
+            timeout=(3.05, 5),
+        )
+        r.raise_for_status()
+    except RequestException as e:
+        # a long link beats no board at all
+        print("failed to shorten {url}: {e}".format(url=url, e=e))
+        return url
     return r.text
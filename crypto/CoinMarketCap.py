@@ -1,15 +1,37 @@
-from requests import request, Response
+from bot.httpclient import http
+from bot.metrics import cacheRequests
+from requests import Response
 from json import loads, JSONDecoder
-from .models import Listings, Listing, ListingsDecoder
-from typing import Dict, List, Tuple
+from .models import Listings, Listing, ListingsDecoder, QuotesDecoder, Snapshot
+from .budget import CreditBudget
+from .snapshots import LOCK_SECONDS, SnapshotStore
+from .sources import PriceSource
+from threading import Lock, Thread
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Tuple,
+    TypeVar,
+)
 import os
+import re
 import time
 
 CMC_API_KEY = os.getenv("CMC_API_KEY", "")
-if CMC_API_KEY == "":
-    raise TypeError(
-        "\n[ERROR] please add CMC_API_KEY (CoinMarketCap API Key) to your ENV"
-    )
+# when set, every listings response is also saved there, for ReplayPriceSource
+CMC_RECORD_DIR = os.getenv("CMC_RECORD_DIR")
+
+
+T = TypeVar("T")
+
+LISTINGS_CREDITS = 1  # the top 200
+QUOTES_PER_CREDIT = 100
+_SYMBOL = re.compile("^[A-Za-z0-9]{1,20}$")
 
 
 def current_time_ms() -> int:
@@ -17,10 +39,29 @@ def current_time_ms() -> int:
 
 
 class CachedGet:
-    def __init__(self, cache_time_ms: int) -> None:
-        self.cache: Dict[str, Tuple[Response, int]] = {}
+    # caches the parsed result of each GET, not the raw response, so readers
+    # between refreshes don't pay for decoding.
+    # only one fetch per url is ever in flight: once an entry is older than
+    # refresh_ahead of its ttl it is refreshed in the background, and while
+    # that runs (or after it expired, up to max_stale_ms) callers get the
+    # previous value instead of waiting. only a missing or very stale entry
+    # makes callers wait, and concurrent waiters share one fetch.
+
+    REFRESH_AHEAD = 0.8
+
+    def __init__(self, cache_time_ms: int, max_stale_ms: Optional[int] = None) -> None:
+        self.cache: Dict[str, Tuple[Any, int]] = {}
         self.cache_time_ms = cache_time_ms
+        self.max_stale_ms = cache_time_ms if max_stale_ms is None else max_stale_ms
         self.total_api_calls = 0
+        self.stats = {"hit": 0, "miss": 0, "stale": 0, "coalesced": 0}
+        self._locks: Dict[str, Lock] = {}
+        self._locksLock = Lock()
+
+    def _age(self, url: str) -> Optional[int]:
+        if url not in self.cache:
+            return None
+        return current_time_ms() - self.cache[url][1]
 
     def _isOld(self, t: int) -> bool:
         return current_time_ms() - t > self.cache_time_ms
@@ -34,47 +75,270 @@ class CachedGet:
         return isNotInCache or isStaleInCache
 
     def request(
-        self, method: str, url: str, headers: Dict[str, str], params: Dict[str, str]
-    ) -> Response:
-        if self._needsCacheRefresh(url):
-            print("cache stale; fetching {url}".format(url=url))
-            resp = request(method, url, headers=headers, params=params)
-            self.total_api_calls = self.total_api_calls + 1
-            print("{n} api calls made".format(n=self.total_api_calls))
-            self.cache[url] = (resp, current_time_ms())
-            return resp
-        else:
+        self,
+        method: str,
+        url: str,
+        headers: Dict[str, str],
+        params: Dict[str, str],
+        parse: Callable[[Response, int], T],
+        fresh: bool = False,
+    ) -> T:
+        # parse(response, fetched_at_ms) runs once per refresh. with fresh,
+        # an expired entry is never returned, the caller waits for the fetch
+        fetch = lambda: self._fetch(method, url, headers, params, parse)
+        age = self._age(url)
+
+        if age is not None and age <= self.cache_time_ms:
+            self._count("hit")
+            if age > self.cache_time_ms * CachedGet.REFRESH_AHEAD:
+                self._refreshInBackground(url, fetch)
+            return self.cache[url][0]
+
+        if (
+            not fresh
+            and age is not None
+            and age <= self.cache_time_ms + self.max_stale_ms
+        ):
+            self._count("stale")
+            self._refreshInBackground(url, fetch)
             return self.cache[url][0]
 
+        lock = self._lock(url)
+        if not lock.acquire(blocking=False):
+            # someone else is fetching this url, wait for their result
+            self._count("coalesced")
+            with lock:
+                if url in self.cache and not self._needsCacheRefresh(url):
+                    return self.cache[url][0]
+            return self.request(method, url, headers, params, parse, fresh)
+        try:
+            self._count("miss")
+            return fetch()
+        finally:
+            lock.release()
 
-class CoinMarketCapApi:
+    def _fetch(self, method, url, headers, params, parse):
+        print("cache stale; fetching {url}".format(url=url))
+        resp = http.request(method, url, headers=headers, params=params)
+        self.total_api_calls = self.total_api_calls + 1
+        print("{n} api calls made".format(n=self.total_api_calls))
+        now = current_time_ms()
+        value = parse(resp, now)
+        self.cache[url] = (value, now)
+        return value
+
+    def _refreshInBackground(self, url: str, fetch: Callable) -> None:
+        lock = self._lock(url)
+        if not lock.acquire(blocking=False):
+            return  # already refreshing
+
+        def refresh():
+            try:
+                fetch()
+            except Exception as e:
+                print("background refresh of {url} failed: {e}".format(url=url, e=e))
+            finally:
+                lock.release()
+
+        Thread(target=refresh, daemon=True).start()
+
+    def _lock(self, url: str) -> Lock:
+        with self._locksLock:
+            return self._locks.setdefault(url, Lock())
+
+    def _count(self, result: str) -> None:
+        self.stats[result] += 1
+        cacheRequests.inc(result)
+
+
+class CoinMarketCapApi(PriceSource):
 
     URL = "https://pro-api.coinmarketcap.com/v1/{resource}"
-    REFRESH_TIME_MS = 1 * 60 * 1000  # data refreshes every 1 min
+    LISTINGS_URL = URL.format(resource="cryptocurrency/listings/latest")
+    QUOTES_URL = URL.format(resource="cryptocurrency/quotes/latest")
+    REFRESH_TIME_MS = 1 * 60 * 1000  # data refreshes every 1 min, without a budget
 
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        store: Optional[SnapshotStore] = None,
+        budget: Optional[CreditBudget] = None,
+    ) -> None:
+        if CMC_API_KEY == "":
+            raise TypeError(
+                "\n[ERROR] please add CMC_API_KEY (CoinMarketCap API Key) to your ENV"
+            )
         self.getter = CachedGet(CoinMarketCapApi.REFRESH_TIME_MS)
+        self.store = store
+        self.budget = budget
+        self._merging = Lock()
+        self._unknown: Dict[str, int] = {}  # symbols quotes/latest didn't know
 
-    def getListings(self) -> Listings:
-        resp = self.getter.request(
+    def getSnapshot(self, fresh: bool = False) -> Snapshot:
+        # with a budget, the snapshot is kept for as long as the credits
+        # left for today require. an expired one is still returned while
+        # the next is fetched, unless fresh is set
+        ttl = self.ttlMs()
+        self.getter.cache_time_ms = ttl
+        # with a store, only the process that claims the refresh calls
+        # CoinMarketCap, the others keep reading the shared snapshot
+        if self.store is not None:
+            shared = self.store.latest(ttl)
+            if shared is not None and (
+                current_time_ms() - shared.fetched_at_ms <= ttl
+                or not self.store.claim()
+            ):
+                return self._awaitShared(shared, ttl) if fresh else shared
+        return self.getter.request(
             "get",
-            CoinMarketCapApi.URL.format(resource="cryptocurrency/listings/latest"),
+            CoinMarketCapApi.LISTINGS_URL,
             {
                 "X-CMC_PRO_API_KEY": CMC_API_KEY,
             },
-            {"limit": "200", "cryptocurrency_type": "all", "sort": "market_cap", "sort_dir": "desc"},
+            {
+                "limit": "200",
+                "cryptocurrency_type": "all",
+                "sort": "market_cap",
+                "sort_dir": "desc",
+            },
+            self._parseAndShare,
+            fresh,
         )
-        return loads(resp.text, cls=ListingsDecoder)
-
-    def getPrices(self) -> Dict[str, float]:
-        listings = self.getListings().data
-        print(listings[0])
-        return {
-            listing.symbol.lower(): listing.quote["USD"]["price"]
-            for listing in listings
-        }
-
-    def getTopNListings(self, n: int) -> List[Listing]:
-        listings = self.getListings().data
-        sortedListings = sorted(listings, key=lambda l: l.cmc_rank)[0:n]
-        return sortedListings
+
+    def getFreshSnapshot(self) -> Snapshot:
+        return self.getSnapshot(fresh=True)
+
+    def _awaitShared(self, shared: Snapshot, ttl: int) -> Snapshot:
+        # another process claimed the refresh: wait for it to put the new
+        # snapshot, for as long as its claim lasts
+        deadline = time.time() + LOCK_SECONDS
+        while current_time_ms() - shared.fetched_at_ms > ttl:
+            if time.time() > deadline:
+                break
+            time.sleep(0.1)
+            shared = self.store.latest(ttl) or shared  # type: ignore
+        return shared
+
+    def _parseAndShare(self, resp: Response, fetched_at_ms: int) -> Snapshot:
+        listings = loads(resp.text, cls=ListingsDecoder)
+        if CMC_RECORD_DIR:
+            _record(resp.text, fetched_at_ms)
+        if self.budget is not None:
+            self.budget.spend(listings.status.credit_count)
+        with self._merging:
+            previous = self._current()
+            if previous is None:
+                snapshot = Snapshot.of(listings, fetched_at_ms)
+            else:
+                snapshot = previous.withListings(listings, fetched_at_ms)
+            if self.store is not None:
+                self.store.put(resp.text, snapshot)
+        return snapshot
+
+    def _current(self) -> Optional[Snapshot]:
+        # the latest snapshot, without refreshing it
+        if self.store is not None:
+            shared = self.store.latest()
+            if shared is not None:
+                return shared
+        cached = self.getter.cache.get(CoinMarketCapApi.LISTINGS_URL)
+        return cached[0] if cached else None
+
+    def _withSymbols(self, symbols: Iterable[str]) -> Snapshot:
+        ttl = self.ttlMs()
+        now = current_time_ms()
+        wanted = {s.lower() for s in symbols if _SYMBOL.match(s)}
+        wanted = {s for s in wanted if now - self._unknown.get(s, 0) > ttl}
+        if not wanted:
+            # nothing to quote, so the listings are refreshed as usual
+            return self.getSnapshot()
+        snapshot = self._current() or self.getSnapshot()
+        stale = [s for s in wanted if _isStale(snapshot.pricedAt(s), now, ttl)]
+        if not stale:
+            return snapshot
+
+        # listings/latest refreshes the top 200 for one credit, quotes/latest
+        # costs a credit per 100 symbols; on a tie the listings are fresher
+        if now - snapshot.fetched_at_ms > ttl:
+            unlisted = [s for s in stale if not snapshot.listed(s)]
+            if LISTINGS_CREDITS + _quotesCredits(unlisted) <= _quotesCredits(stale):
+                snapshot = self.getSnapshot()
+                stale = unlisted
+        if stale:
+            snapshot = self._quote(stale, snapshot)
+        return snapshot
+
+    def _quote(self, symbols: List[str], base: Snapshot) -> Snapshot:
+        with self._merging:
+            # whoever held the lock before may have just quoted them
+            snapshot = self._current() or base
+            ttl, now = self.ttlMs(), current_time_ms()
+            symbols = [
+                s
+                for s in symbols
+                if _isStale(snapshot.pricedAt(s), now, ttl)
+                and now - self._unknown.get(s, 0) > ttl
+            ]
+            if not symbols:
+                return snapshot
+            quotes = self._fetchQuotes(symbols)
+            now = current_time_ms()
+            found = {l.symbol.lower() for l in quotes}
+            for symbol in symbols:
+                if symbol not in found:
+                    self._unknown[symbol] = now
+            snapshot = self._current() or snapshot
+            if not quotes:
+                return snapshot
+            snapshot = snapshot.withQuotes(quotes, now)
+            if self.store is not None:
+                self.store.putQuotes(snapshot)
+            url = CoinMarketCapApi.LISTINGS_URL
+            if url in self.getter.cache:
+                self.getter.cache[url] = (snapshot, self.getter.cache[url][1])
+            return snapshot
+
+    def _fetchQuotes(self, symbols: List[str]) -> List[Listing]:
+        print("fetching quotes for {symbols}".format(symbols=symbols))
+        resp = http.get(
+            CoinMarketCapApi.QUOTES_URL,
+            headers={"X-CMC_PRO_API_KEY": CMC_API_KEY},
+            params={"symbol": ",".join(s.upper() for s in symbols)},
+        )
+        quotes = loads(resp.text, cls=QuotesDecoder)
+        if quotes.status.error_code:
+            # one unknown symbol fails the whole call, errors cost no credits
+            print("quotes failed: {e}".format(e=quotes.status.error_message))
+            if len(symbols) == 1:
+                return []
+            return [l for s in symbols for l in self._fetchQuotes([s])]
+        if self.budget is not None:
+            self.budget.spend(quotes.status.credit_count)
+        return list((quotes.data or {}).values())
+
+    def ttlMs(self) -> int:
+        # how long a snapshot is kept
+        if self.budget is None:
+            return CoinMarketCapApi.REFRESH_TIME_MS
+        return int(self.budget.interval() * 1000)
+
+    def getPrices(self, symbols: Optional[Iterable[str]] = None) -> Mapping[str, float]:
+        # read-only, shared by every caller until the next refresh.
+        # symbols that are missing (not in the top 200) or stale are fetched
+        # with whichever call costs fewer credits, and merged into the snapshot
+        if symbols is None:
+            return self.getSnapshot().prices
+        return self._withSymbols(symbols).prices
+
+
+def _isStale(pricedAt: Optional[int], now: int, ttl: int) -> bool:
+    return pricedAt is None or now - pricedAt > ttl
+
+
+def _quotesCredits(symbols: List[str]) -> int:
+    return -(-len(symbols) // QUOTES_PER_CREDIT)
+
+
+def _record(body: str, fetched_at_ms: int) -> None:
+    path = os.path.join(CMC_RECORD_DIR, "{t}.json".format(t=fetched_at_ms))
+    with open(path, "w") as f:
+        f.write(body)
@@ -1,91 +1,112 @@
 from .CryptoTrader import (
     CryptoTrader,
     Alert,
+    If,
     Buy,
     Sell,
     User,
     InsufficientFundsError,
     InsufficientCoinsError,
 )
+from .history import PriceHistory
 from bot.Bot import Bot, Command, SlackBot
 from typing import Dict, List, Union, Optional
 import threading
 
+MOVER_SECONDS = 30 * 60
+MOVER_CHANGE = 0.1  # a coin up or down this much over MOVER_SECONDS is posted
+
 
 class CryptoBot(SlackBot):
-    def __init__(self, token, bot: Bot, trader: CryptoTrader) -> None:
-        super().__init__(token, bot, None)
+    def __init__(
+        self, token, bot: Bot, trader: CryptoTrader, connect: bool = True
+    ) -> None:
+        super().__init__(token, bot, None, connect)
         self.prices: Dict[str, float] = {}
         self.trader = trader
         self.lastLeaderboard: Union[str, None] = None
         self.lastTopCoins: Union[str, None] = None
+        # coin -> 1 or -1, the way it was last posted moving
+        self.movers: Dict[str, int] = {}
+        self.history = PriceHistory(trader.db)
+        self.history.load()
         self.poll_and_execute_ifs()
 
     def poll_and_execute_ifs(self) -> None:
-        # poll every 30 minutes
-        # CoinMarketCap API limit is only 300 calls per day, so we need to limit the poll frequency here
-        threading.Timer(60 * 30, self.poll_and_execute_ifs).start()
-
-        # get all users
-        self.old_prices = self.prices
-        self.prices = self.trader.api.getPrices()
-        if self.old_prices:
-            msg = ''
-            for ticker,price in self.prices.items():
-                old_price = self.old_prices[ticker]
-                change = 1 - price/old_price
-                if change >= .1:
-                    msg += "{} is UP {:.1%} in the last 30 min\n".format(ticker,change)
-                elif change <= -.1:
-                    msg += "{} is DOWN {:.1%} in the last 30 min\n".format(ticker,abs(change))
-            msg = msg.strip()
-            if msg != '':
-                self.api_call(
-                    "chat.postMessage",
-                    channel="#crypto-notifications",
-                    text=_mono(msg),
-                    username=self.bot.name,
-                    icon_emoji=self.bot.icon_emoji,
+        # poll as often as the CoinMarketCap credit budget allows, see crypto/budget.py
+        # a few seconds late, so the snapshot from the last poll has expired
+        self.pollTimer = threading.Timer(
+            self.trader.budget.interval() + 5, self.poll_and_execute_ifs
+        )
+        self.pollTimer.start()
+
+        # the top 200 are refreshed, and the coins with an armed if are
+        # priced even outside them. only the users whose ifs these prices
+        # crossed are loaded, see crypto/triggers.py
+        self.trader.api.getFreshSnapshot()
+        self.prices = self.trader.api.getPrices(self.trader.triggers.coins())
+        triggered, nearest = self.trader.triggered(self.prices)
+        for user, ifs in triggered:
+            self.execute_ifs(user, ifs, self.prices)
+        # everybody's net worth at the new snapshot, for the leaderboard
+        self.trader.revalueAll()
+        self.history.record(self.prices)
+        self.history.save()
+        msg = self._movers()
+        if msg != "":
+            self.postMessage("#crypto-notifications", _mono(msg))
+        self.trader.budget.nearestIf(nearest)
+
+    def _movers(self) -> str:
+        # coins that started moving since the last poll, biggest move first.
+        # polls come every 1-30 min, so a move over the last 30 min is seen
+        # by several of them; it's only posted when the coin crosses
+        # MOVER_CHANGE (or turns around), not again until it drops back under
+        table = self.trader.api.getSnapshot().table
+        changes = self.history.changes(table.symbols, MOVER_SECONDS)
+        moving = dict(table.screen(changes, MOVER_CHANGE))
+        for ticker in list(self.movers):
+            if ticker not in moving:
+                del self.movers[ticker]
+        lines = []
+        for ticker, change in moving.items():
+            direction = 1 if change > 0 else -1
+            if self.movers.get(ticker) != direction:
+                self.movers[ticker] = direction
+                lines.append(
+                    "{} is {} {:.1%} in the last 30 min".format(
+                        ticker, "UP" if direction > 0 else "DOWN", abs(change)
+                    )
                 )
-        for user in self.trader.getAllUsers():
-            self.execute_ifs(user, self.prices)
+        return "\n".join(lines)
 
-    def execute_ifs(self, user: User, prices: Dict[str, float]) -> None:
+    def execute_ifs(self, user: User, ifs: List[If], prices: Dict[str, float]) -> None:
+        # ifs are the user's ifs the trigger book found crossed
         idx = 0
-        ifs = user.ifs
+        fired = []
         while idx < len(ifs):
             try:
                 i = ifs[idx]
-                if not i.meets_condition(prices):
-                    print(
-                        "{} if id {} not met: {}".format(
-                            user.user_name, i.id, i.condition.render()
-                        )
-                    )
-                else:
+                if i.meets_condition(prices):
                     print(
                         "{} if id {} triggered! {}".format(
                             user.user_name, i.id, i.condition.render()
                         )
                     )
-                    if i.action["type"] == "alert":  # type: ignore
-                        self.api_call(
-                            "chat.postMessage",
-                            channel="@{}".format(user.user_name),
-                            text="{}".format(i.action["msg"]),  # type: ignore
-                            username=self.bot.name,
-                            icon_emoji=self.bot.icon_emoji,
+                    if isinstance(i.action, Alert):
+                        self.postMessage(
+                            "@{}".format(user.user_name),
+                            "{}".format(i.action.msg),
                         )
 
-                    elif i.action["type"] == "buy":  # type: ignore
-                        coin = i.action["coin"]  # type: ignore
+                    elif isinstance(i.action, Buy):
+                        coin = i.action.coin
                         fromQty = "{0:.6g}".format(user.portfolio[coin] or 0)
-                        buyQty = i.action["qty"]
+                        buyQty = i.action.qty
                         fromUSD = "{0:.2f}".format(user.balance)
-                        self.trader.buy(user.user_name, coin, buyQty)
-                        db_user = self.trader._getUser(user.user_name)
-                        user.portfolio = db_user.portfolio
-                        user.balance = db_user.balance
+                        trade = self.trader.buy(user.user_name, coin, buyQty)
+                        user.portfolio[coin] = trade.holding
+                        user.balance = trade.balance
                         toQty = "{0:.6g}".format(user.portfolio[coin] or 0)
                         toUSD = "{0:.2f}".format(user.balance)
                         msg = "{}\n[triggered] {} USD {} -> {}, {} {} -> {}".format(
@@ -97,23 +118,16 @@ class CryptoBot(SlackBot):
                             fromQty,
                             toQty,
                         )
-                        self.api_call(
-                            "chat.postMessage",
-                            channel="#crypto",
-                            text=_mono(msg),
-                            username=self.bot.name,
-                            icon_emoji=self.bot.icon_emoji,
-                        )
+                        self.postMessage("#crypto", _mono(msg))
                         self._onLeaderboard("#crypto", None)
-                    elif i.action["type"] == "sell":  # type: ignore
-                        coin = i.action["coin"]  # type: ignore
+                    elif isinstance(i.action, Sell):
+                        coin = i.action.coin
                         fromQty = "{0:.6g}".format(user.portfolio[coin] or 0)
-                        sellQty = i.action["qty"]  # type: ignore
+                        sellQty = i.action.qty
                         fromUSD = "{0:.2f}".format(user.balance)
-                        self.trader.sell(user.user_name, coin, sellQty)
-                        db_user = self.trader._getUser(user.user_name)
-                        user.portfolio = db_user.portfolio
-                        user.balance = db_user.balance
+                        trade = self.trader.sell(user.user_name, coin, sellQty)
+                        user.portfolio[coin] = trade.holding
+                        user.balance = trade.balance
                         toQty = "{0:.6g}".format(user.portfolio[coin] or 0)
                         toUSD = "{0:.2f}".format(user.balance)
                         msg = (
@@ -127,29 +141,23 @@ class CryptoBot(SlackBot):
                                 toQty,
                             )
                         )
-                        self.api_call(
-                            "chat.postMessage",
-                            channel="#crypto",
-                            text=_mono(msg),
-                            username=self.bot.name,
-                            icon_emoji=self.bot.icon_emoji,
-                        )
+                        self.postMessage("#crypto", _mono(msg))
                         self._onLeaderboard("#crypto", None)
                     # action succeeded, so remove it from ifs
-                    del ifs[idx]
+                    fired.append(i.id)
             except Exception as e:
                 i = ifs[idx]
-                self.api_call(
-                    "chat.postMessage",
-                    channel="@{}".format(user.user_name),
-                    text="Execution of if failed. Condition: {}, Action: {}, Error: {}".format(
+                self.postMessage(
+                    "@{}".format(user.user_name),
+                    "Execution of if failed. Condition: {}, Action: {}, Error: {}".format(
                         i.condition, i.action, str(e)
                     ),
-                    username=self.bot.name,
-                    icon_emoji=self.bot.icon_emoji,
                 )
             idx = idx + 1
-        self.trader._setUser(user)
+        if fired:
+            # only the ifs are written back, trades were already applied
+            self.trader.deleteIfs(user.user_name, fired)
+            user.ifs = [i for i in ifs if i.id not in fired]
 
     def deleteFileUploads(self, file):
         try:
@@ -389,6 +397,9 @@ class CryptoBot(SlackBot):
 
     def _onLeaderboard(self, channel: str, thread: Optional[str]):
         png = self.trader.leaderboard()
+        # uploads aren't queued, so let the messages to this channel before
+        # it go out first; other channels' queues don't hold it up
+        self.outbox.flush(channel)
         try:
             if self.lastLeaderboard:
                 self.api_call("files.delete", file=self.lastLeaderboard)
@@ -399,7 +410,7 @@ class CryptoBot(SlackBot):
                 username=self.bot.name,
                 icon_emoji=self.bot.icon_emoji,
                 filename="leaderboard.png",
-                file=png
+                file=png,
             )
             self.lastLeaderboard = response["file"]["id"]
         except:
@@ -414,10 +425,11 @@ class CryptoBot(SlackBot):
         # example slack command:
         # "crypto price BTC ETH"
         tickers, channel, thread = cmd.args, cmd.channel, cmd.thread
+        prices = self.trader._getPrices(tickers)
         res = {
-            ticker + ": " + str(price)
-            for ticker, price in self.trader.api.getPrices().items()
-            if ticker.lower() in map(lambda t: t.lower(), tickers)
+            ticker.lower() + ": " + str(prices[ticker.lower()])
+            for ticker in tickers
+            if ticker.lower() in prices
         }
         self.postMessage(channel, _mono(", ".join(res)), thread)
 
@@ -1,13 +1,77 @@
 from dataclasses import dataclass, field
 from dataclasses_json import dataclass_json
-from typing import Dict, List, Tuple, Union
+from typing import (
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
 from typing_extensions import Literal
 from .CoinMarketCap import CachedGet, CoinMarketCapApi
+from .budget import CreditBudget
+from .codec import UserCodec
+from .snapshots import SnapshotStore
+from .sources import PriceSource
+from .table import Holdings
+from .triggers import TriggerBook
 from collections import defaultdict
 from redis import StrictRedis
 from prettytable import PrettyTable
 from imagemaker.makePng import getCryptoLeaderboardPng, getCryptoTopPng
 import json, re, math
+import numpy as np
+
+# a buy or sell, checked and applied in one step inside redis so a trade
+# can't be lost to another one on the same user (from the ifs timer and a
+# command at the same time, say). only the balance and the coin's holding
+# are touched, and the user's net worth in the leaderboard is set from the
+# new holdings in the same step.
+# KEYS: user, holdings, users, net worth  ARGV: initial pot, "buy"/"sell",
+# coin, price, "pct"/"qty", fraction or quantity, user name, json of prices
+# returns {"ok", quantity, balance, holding, net worth}
+# or {"quantity"}/{"insufficient"}
+TRADE_SCRIPT = """
+if redis.call("HSETNX", KEYS[1], "balance", ARGV[1]) == 1 then
+  redis.call("SADD", KEYS[3], ARGV[7])
+  redis.call("ZADD", KEYS[4], "NX", ARGV[1], ARGV[7])
+end
+local balance = tonumber(redis.call("HGET", KEYS[1], "balance"))
+local side, coin, price = ARGV[2], ARGV[3], tonumber(ARGV[4])
+local amount = tonumber(ARGV[6])
+local held = tonumber(redis.call("HGET", KEYS[2], coin)) or 0
+local qty
+if side == "buy" then
+  qty = amount
+  if ARGV[5] == "pct" then qty = balance / price * amount end
+  if qty <= 0 then return {"quantity"} end
+  if balance < price * qty then return {"insufficient"} end
+else
+  if held <= 0 then return {"insufficient"} end
+  qty = amount
+  if ARGV[5] == "pct" then qty = held * amount end
+  if qty <= 0 then return {"quantity"} end
+  if held < qty then return {"insufficient"} end
+  qty = -qty
+end
+-- numbers passed to redis.call as-is would be cut to 14 digits
+balance = redis.call("HINCRBYFLOAT", KEYS[1], "balance",
+  string.format("%.17g", -price * qty))
+held = redis.call("HINCRBYFLOAT", KEYS[2], coin, string.format("%.17g", qty))
+local prices = cjson.decode(ARGV[8])
+local holdings = redis.call("HGETALL", KEYS[2])
+local worth = tonumber(balance)
+for i = 1, #holdings, 2 do
+  worth = worth + tonumber(holdings[i + 1]) * (prices[holdings[i]] or 0)
+end
+worth = string.format("%.17g", worth)
+redis.call("ZADD", KEYS[4], worth, ARGV[7])
+return {"ok", string.format("%.17g", math.abs(qty)), balance, held, worth}
+"""
 
 
 @dataclass_json
@@ -66,7 +130,7 @@ class If:
             )
 
     def render(self) -> str:
-        if self.action["type"] == "alert":
+        if isinstance(self.action, Alert):
             return "[id {}] if {} {} {} alert".format(
                 self.id,
                 self.condition.coin,
@@ -79,9 +143,9 @@ class If:
                 self.condition.coin,
                 self.condition.comparator,
                 self.condition.price,
-                self.action["type"],
-                self.action["coin"],
-                self.action["qty"],
+                self.action.type,
+                self.action.coin,
+                self.action.qty,
             )
 
 
@@ -95,7 +159,11 @@ class User:
 
     def display_portfolio(self) -> Dict[str, float]:
         # don't include entries with small value
-        return {k: round(v,max(0,min(6,6-math.floor(math.log(v,10))))) for k, v in self.portfolio.items() if v >= 1e-6}
+        return {
+            k: round(v, max(0, min(6, 6 - math.floor(math.log(v, 10)))))
+            for k, v in self.portfolio.items()
+            if v >= 1e-6
+        }
 
     def value(self, prices: Dict[str, float]) -> float:
         sum = 0.0
@@ -110,20 +178,44 @@ class User:
             return max([i.id for i in self.ifs]) + 1
 
 
+# encodes ifs for redis, see crypto/codec.py
+codec = UserCodec(User, If, Condition, [Alert, Buy, Sell])
+
+
+@dataclass
+class Trade:
+    quantity: float  # coins bought or sold
+    balance: float  # after the trade
+    holding: float  # of the coin, after the trade
+
+
+USERS_CHUNK = 500  # users read per pipeline
+LEADERBOARD_SIZE = 20
+
+
 class CryptoTrader:
 
     INITIAL_POT_SIZE = 100000
 
-    def __init__(self, db: StrictRedis, group: str) -> None:
+    def __init__(
+        self, db: StrictRedis, group: str, api: Optional[PriceSource] = None
+    ) -> None:
         self.db = db
         self.group = group
-        self.api = CoinMarketCapApi()
-
-    def buy(self, user_name: str, ticker: str, quantity: str) -> None:
-        user = self._getUser(user_name)
-        prices = self.api.getPrices()
+        self.budget = CreditBudget(db)
+        self.api = api or CoinMarketCapApi(SnapshotStore(db), self.budget)
+        self.triggers = TriggerBook(db, group)
+        self._trade = db.register_script(TRADE_SCRIPT)
+
+    def _getPrices(self, coins: Optional[Iterable[str]] = None) -> Dict[str, float]:
+        # prices for a user's command, which makes the budget refresh sooner.
+        # coins are priced even if they aren't in the top 200
+        self.budget.demand()
+        return self.api.getPrices(coins)  # type: ignore
+
+    def buy(self, user_name: str, ticker: str, quantity: str) -> Trade:
+        prices = self._getPrices([ticker])
         ticker = ticker.lower()
-        qty = 0.0
 
         if ticker not in prices:
             raise InvalidCoinError(
@@ -132,77 +224,125 @@ class CryptoTrader:
                 )
             )
 
-        if quantity == 'all' or quantity == 'max': quantity = '100%'
-        elif quantity == 'half': quantity = '50%'
-        
-        if re.match('^\d+\.?\d*%$',quantity):
-            qty = user.balance/prices[ticker] * max(0,min(100,float(quantity.strip('%'))/100))
-        else:
-            try:
-                qty = float(quantity)
-            except:
-                raise InvalidBuyQuantityError(
-                    "Either buy a numeric amount of coin, or specify 'max', 'all', 'half', or some percentage."
-                )
-        if qty <= 0:
+        mode, amount = _parseQuantity(
+            quantity,
+            InvalidBuyQuantityError(
+                "Either buy a numeric amount of coin, or specify 'max', 'all', 'half', or some percentage."
+            ),
+        )
+        result = self._runTrade(user_name, "buy", ticker, prices, mode, amount)
+        if result[0] == b"quantity":
             raise InvalidBuyQuantityError("Buy quantity must be greater than zero.")
-
-        purchasePrice = prices[ticker] * qty
-        if user.balance >= purchasePrice:
-            user.portfolio[ticker] = (
-                user.portfolio.get(ticker) or 0
-            )  # initialize if needed
-            user.portfolio[ticker] += qty
-            user.balance = user.balance - purchasePrice
-            self._setUser(user)
-        else:
+        elif result[0] == b"insufficient":
             raise InsufficientFundsError(
                 "{user_name} is out of dough!".format(user_name=user_name)
             )
+        return Trade(float(result[1]), float(result[2]), float(result[3]))
 
-    def sell(self, user_name: str, ticker: str, quantity: str) -> None:
-        user = self._getUser(user_name)
-        prices = self.api.getPrices()
+    def sell(self, user_name: str, ticker: str, quantity: str) -> Trade:
+        prices = self._getPrices([ticker])
         ticker = ticker.lower()
-        qty = 0.0
-
-        if quantity == 'all' or quantity == 'max': quantity = '100%'
-        elif quantity == 'half': quantity = '50%'
 
-        if re.match('^\d+\.?\d*%$',quantity):
-            qty = user.portfolio[ticker] * max(0,min(100,float(quantity.strip('%'))/100))
-        else:
-            try:
-                qty = float(quantity)
-            except:
-                raise InvalidSellQuantityError(
-                    "Either sell a numeric amount of coin, or specify 'max', 'all', 'half', or some percentage."
+        mode, amount = _parseQuantity(
+            quantity,
+            InvalidSellQuantityError(
+                "Either sell a numeric amount of coin, or specify 'max', 'all', 'half', or some percentage."
+            ),
+        )
+        if mode == "qty" and amount <= 0:
+            raise InvalidSellQuantityError("Sell quantity must be greater than zero.")
+        if ticker not in prices:
+            # nothing to price the sale at, so nothing can be held either
+            raise InsufficientCoinsError(
+                "{user_name} don't have {coin} coins to sell!".format(
+                    user_name=user_name, coin=ticker
                 )
-        if qty <= 0:
+            )
+        result = self._runTrade(user_name, "sell", ticker, prices, mode, amount)
+        if result[0] == b"quantity":
             raise InvalidSellQuantityError("Sell quantity must be greater than zero.")
-
-        if user.portfolio.get(ticker) and user.portfolio[ticker] >= qty:
-            sellPrice = prices[ticker] * qty
-            user.portfolio[ticker] -= qty
-            user.balance += sellPrice
-            self._setUser(user)
-        else:
+        elif result[0] == b"insufficient":
             raise InsufficientCoinsError(
                 "{user_name} don't have {coin} coins to sell!".format(
                     user_name=user_name, coin=ticker
                 )
             )
+        return Trade(float(result[1]), float(result[2]), float(result[3]))
+
+    def _runTrade(
+        self,
+        user_name: str,
+        side: str,
+        ticker: str,
+        prices: Mapping[str, float],
+        mode: str,
+        amount: float,
+    ) -> List[bytes]:
+        # checks and applies the trade inside redis, see TRADE_SCRIPT.
+        # the prices value the user's holdings for the leaderboard
+        return self._trade(
+            keys=[
+                self._key("user", user_name),
+                self._key("holdings", user_name),
+                usersKey(self.group),
+                netWorthKey(self.group),
+            ],
+            args=[
+                CryptoTrader.INITIAL_POT_SIZE,
+                side,
+                ticker,
+                repr(float(prices[ticker])),
+                mode,
+                repr(amount),
+                user_name,
+                json.dumps(dict(prices)),
+            ],
+        )
 
     def deleteIf(self, user_name: str, id: int) -> None:
-        user = self._getUser(user_name)
-        user.ifs = [i for i in user.ifs if i.id != id]
-        self._setUser(user)
+        self.deleteIfs(user_name, [id])
+
+    def deleteIfs(self, user_name: str, ids: Iterable[int]) -> None:
+        ids = list(ids)
+        if not ids:
+            return
+        key = self._key("ifs", user_name)
+        saved = self.db.hmget(key, ids)
+        pipe = self.db.pipeline()
+        pipe.hdel(key, *ids)
+        for data in saved:
+            if data:
+                self.triggers.remove(user_name, codec.decodeIf(data), pipe)
+        pipe.execute()
+
+    def triggered(
+        self, prices: Mapping[str, float]
+    ) -> Tuple[List[Tuple[User, List[If]]], Optional[float]]:
+        # users with ifs that the prices meet, with those ifs, and how far
+        # the closest if not met yet is from its price
+        crossed, nearest = self.triggers.crossed(prices)
+        fired: Dict[str, List[Tuple[int, str]]] = {}
+        for user_name, id, key in crossed:
+            fired.setdefault(user_name, []).append((id, key))
+        triggered = []
+        stale = self.db.pipeline()
+        found = {user.user_name: user for user in self._readUsers(list(fired))}
+        for user_name, hits in fired.items():
+            user = found.get(user_name)
+            ifs = {i.id: i for i in user.ifs} if user else {}
+            if user and any(id in ifs for id, _ in hits):
+                triggered.append((user, [ifs[id] for id, _ in hits if id in ifs]))
+            for id, key in hits:
+                if id not in ifs:
+                    # left behind by an if or user that is gone
+                    self.triggers.discard(key, user_name, id, stale)
+        stale.execute()
+        return triggered, nearest
 
     def setAlertIf(
         self, user_name: str, coin: str, comparator: str, amount: float
     ) -> None:
-        user = self._getUser(user_name)
-        prices = self.api.getPrices()
+        prices = self._getPrices([coin])
 
         if coin not in prices:
             raise InvalidCoinError(
@@ -226,19 +366,15 @@ class CryptoTrader:
                 "Invalid alert. Price of {} is already < {}".format(coin, amount)
             )
         else:
-            id = user.get_next_if_id()
-            user.ifs.append(
-                If(
-                    id,
-                    Condition(coin, comparator, amount),
-                    Alert(
-                        msg="Alert! The price of {} is {} {}.".format(
-                            coin, comparator, amount
-                        )
-                    ),
-                )
+            self._addIf(
+                user_name,
+                Condition(coin, comparator, amount),
+                Alert(
+                    msg="Alert! The price of {} is {} {}.".format(
+                        coin, comparator, amount
+                    )
+                ),
             )
-            self._setUser(user)
 
     def setBuyIf(
         self,
@@ -249,8 +385,7 @@ class CryptoTrader:
         buyCoin: str,
         buyQty: str,
     ) -> None:
-        user = self._getUser(user_name)
-        prices = self.api.getPrices()
+        prices = self._getPrices([coin, buyCoin])
 
         if coin not in prices:
             raise InvalidCoinError(
@@ -264,12 +399,17 @@ class CryptoTrader:
                 )
             )
 
-        if buyQty == 'all' or buyQty == 'max': buyQty = '100%'
-        elif buyQty == 'half': buyQty = '50%'
-        
-        if not re.match('^\d+\.?\d*%$',buyQty):
+        if buyQty == "all" or buyQty == "max":
+            buyQty = "100%"
+        elif buyQty == "half":
+            buyQty = "50%"
+
+        if not re.match("^\d+\.?\d*%$", buyQty):
             try:
-                if float(buyQty) <= 0: raise InvalidBuyQuantityError("Buy quantity must be greater than zero.")
+                if float(buyQty) <= 0:
+                    raise InvalidBuyQuantityError(
+                        "Buy quantity must be greater than zero."
+                    )
             except:
                 raise InvalidBuyQuantityError(
                     "Either buy a numeric amount of coin, or specify 'max', 'all', 'half', or some percentage."
@@ -287,15 +427,11 @@ class CryptoTrader:
                 "Invalid buy. Price of {} is already < {}".format(coin, amount)
             )
         else:
-            id = user.get_next_if_id()
-            user.ifs.append(
-                If(
-                    id,
-                    Condition(coin, comparator, amount),
-                    Buy(coin=buyCoin, qty=buyQty),  # either float or percentage
-                )
+            self._addIf(
+                user_name,
+                Condition(coin, comparator, amount),
+                Buy(coin=buyCoin, qty=buyQty),  # either float or percentage
             )
-            self._setUser(user)
 
     def setSellIf(
         self,
@@ -306,8 +442,7 @@ class CryptoTrader:
         sellCoin: str,
         sellQty: str,
     ) -> None:
-        user = self._getUser(user_name)
-        prices = self.api.getPrices()
+        prices = self._getPrices([coin, sellCoin])
 
         if coin not in prices:
             raise InvalidCoinError(
@@ -321,12 +456,17 @@ class CryptoTrader:
                 )
             )
 
-        if sellQty == 'all' or sellQty == 'max': sellQty = '100%'
-        elif sellQty == 'half': sellQty = '50%'
-        
-        if not re.match('^\d+\.?\d*%$',sellQty):
+        if sellQty == "all" or sellQty == "max":
+            sellQty = "100%"
+        elif sellQty == "half":
+            sellQty = "50%"
+
+        if not re.match("^\d+\.?\d*%$", sellQty):
             try:
-                if float(sellQty) <= 0: raise InvalidSellQuantityError("Sell quantity must be greater than zero.")
+                if float(sellQty) <= 0:
+                    raise InvalidSellQuantityError(
+                        "Sell quantity must be greater than zero."
+                    )
             except:
                 raise InvalidSellQuantityError(
                     "Either sell a numeric amount of coin, or specify 'max', 'all', 'half', or some percentage."
@@ -344,57 +484,140 @@ class CryptoTrader:
                 "Invalid sell. Price of {} is already < {}".format(coin, amount)
             )
         else:
-            id = user.get_next_if_id()
-            user.ifs.append(
-                If(
-                    id,
-                    Condition(coin, comparator, amount),
-                    Sell(coin=sellCoin, qty=sellQty),  # either float or some percentage
-                )
+            self._addIf(
+                user_name,
+                Condition(coin, comparator, amount),
+                Sell(coin=sellCoin, qty=sellQty),  # either float or some percentage
             )
-            self._setUser(user)
 
-    def _key(self, user_name: str) -> str:
-        return "cryptoTrader.{group}.json.{user_name}".format(
-            group=self.group, user_name=user_name
-        )
+    def _addIf(self, user_name: str, condition: Condition, action) -> None:
+        pipe = self.db.pipeline()
+        self._ensureUser(pipe, user_name)
+        pipe.hincrby(self._key("user", user_name), "if_id", 1)
+        id = pipe.execute()[3]
+        i = If(id, condition, action)
+        pipe = self.db.pipeline()
+        pipe.hset(self._key("ifs", user_name), id, codec.encodeIf(i))
+        self.triggers.add(user_name, i, pipe)
+        pipe.execute()
+
+    def _key(self, kind: str, user_name: str) -> str:
+        return userKey(self.group, kind, user_name)
+
+    def _ensureUser(self, pipe, user_name: str) -> None:
+        # queues creating the user if needed (three replies)
+        pot = CryptoTrader.INITIAL_POT_SIZE
+        pipe.hsetnx(self._key("user", user_name), "balance", pot)
+        pipe.sadd(usersKey(self.group), user_name)
+        pipe.execute_command("ZADD", netWorthKey(self.group), "NX", pot, user_name)
 
     def _getUser(self, user_name: str) -> User:
-        if not self.db.get(self._key(user_name)):
-            self._setUser(User(user_name, CryptoTrader.INITIAL_POT_SIZE, {}))
-        return User.from_json(self.db.get(self._key(user_name)))  # type: ignore
+        pipe = self.db.pipeline(transaction=False)
+        self._ensureUser(pipe, user_name)
+        self._readUser(pipe, user_name)
+        return self._toUser(user_name, *pipe.execute()[3:])
 
     def getAllUsers(self) -> List[User]:
-        userKeys = self.db.keys("cryptoTrader.{g}.json.*".format(g=self.group))
-        if not userKeys:
-            return []
-        return [User.from_json(u) for u in self.db.mget(userKeys)]  # type: ignore
+        return list(self.iterUsers())
+
+    def iterUsers(self, chunk: int = USERS_CHUNK) -> Iterator[User]:
+        for users in self.iterUserChunks(chunk):
+            yield from users
+
+    def iterUserChunks(self, chunk: int = USERS_CHUNK) -> Iterator[List[User]]:
+        # every user, read `chunk` at a time: names come from the users set
+        # with SSCAN (which doesn't block redis like KEYS), and each chunk's
+        # hashes are read in one pipeline
+        seen: Set[str] = set()  # SSCAN can return a name twice
+        names: List[str] = []
+        for name in self.db.sscan_iter(usersKey(self.group), count=chunk):
+            user_name = name.decode("utf-8")
+            if user_name in seen:
+                continue
+            seen.add(user_name)
+            names.append(user_name)
+            if len(names) == chunk:
+                yield self._readUsers(names)
+                names = []
+        if names:
+            yield self._readUsers(names)
+
+    def _readUsers(self, names: List[str]) -> List[User]:
+        pipe = self.db.pipeline(transaction=False)
+        for user_name in names:
+            self._readUser(pipe, user_name)
+        replies = pipe.execute()
+        return [
+            self._toUser(user_name, *replies[3 * n : 3 * n + 3])
+            for n, user_name in enumerate(names)
+            if replies[3 * n]  # deleted since the scan
+        ]
+
+    def _readUser(self, pipe, user_name: str) -> None:
+        pipe.hgetall(self._key("user", user_name))
+        pipe.hgetall(self._key("holdings", user_name))
+        pipe.hgetall(self._key("ifs", user_name))
+
+    def _toUser(self, user_name: str, fields, holdings, ifs) -> User:
+        return User(
+            user_name,
+            float(fields[b"balance"]),
+            {coin.decode("utf-8"): float(qty) for coin, qty in holdings.items()},
+            sorted(
+                (codec.decodeIf(i) for i in ifs.values()),
+                key=lambda i: i.id,
+            ),
+        )
 
     def _setUser(self, user: User) -> None:
-        self.db.set(self._key(user.user_name), user.to_json())  # type: ignore
+        pipe = self.db.pipeline()
+        writeUser(pipe, self.group, user)
+        pipe.execute()
 
     def create_user(self, user_name):
-        if not self.db.get(self._key(user_name)):
-            self._setUser(User(user_name, 100000, {}))
+        pipe = self.db.pipeline()
+        self._ensureUser(pipe, user_name)
+        pipe.execute()
 
     def delete_user(self, user_name: str) -> None:
-        if self.db.get(self._key(user_name)):
-            self.db.delete(self._key(user_name))
+        ifs = self.db.hvals(self._key("ifs", user_name))
+        pipe = self.db.pipeline()
+        for data in ifs:
+            self.triggers.remove(user_name, codec.decodeIf(data), pipe)
+        pipe.srem(usersKey(self.group), user_name)
+        pipe.zrem(netWorthKey(self.group), user_name)
+        pipe.delete(
+            self._key("user", user_name),
+            self._key("holdings", user_name),
+            self._key("ifs", user_name),
+        )
+        pipe.execute()
 
     def status(self, user_name: str) -> str:
         user = self._getUser(user_name)
+        value = user.value(self._getPrices(user.portfolio.keys()))
+        key = netWorthKey(self.group)
+        pipe = self.db.pipeline()
+        pipe.execute_command("ZADD", key, value + user.balance, user_name)
+        pipe.zrevrank(key, user_name)
+        pipe.zcard(key)
+        _, rank, count = pipe.execute()
         return (
             "```User {user_name} has ${balance} to spend.\n"
             + "Coins owned: {portfolio}\n"
-            + "Portfolio value is ${value}```"
+            + "Portfolio value is ${value}\n"
+            + "Ranked #{rank} of {count}```"
         ).format(
             user_name=user.user_name,
             balance=user.balance,
             portfolio=user.display_portfolio(),
-            value=user.value(self.api.getPrices()),
+            value=value,
+            rank=rank + 1,
+            count=count,
         )
 
     def topCoins(self, n: int) -> str:
+        self.budget.demand()
         topListings = self.api.getTopNListings(n)
 
         rows = []
@@ -413,36 +636,69 @@ class CryptoTrader:
 
         return getCryptoTopPng(rows)
 
-    def leaderboard(self):
-        users = self.getAllUsers()
-
+    def revalue(self, users: List[User]) -> np.ndarray:
+        # values users' coins at the snapshot's prices and updates their net
+        # worth in the leaderboard
         if not users:
+            return np.zeros(0)
+        values = self.api.getSnapshot().table.values(
+            Holdings([u.portfolio for u in users])
+        )
+        scores: List[Union[float, str]] = []
+        for user, value in zip(users, values):
+            scores += [float(value) + user.balance, user.user_name]
+        self.db.execute_command("ZADD", netWorthKey(self.group), *scores)
+        return values
+
+    def revalueAll(self) -> bool:
+        # everybody's net worth at the latest snapshot, once per listings
+        # fetch across every process, a chunk of users at a time so they are
+        # never all in memory. False if this snapshot was already done
+        version = self.api.getSnapshot().fetched_at_ms
+        done = self.db.getset(valuedKey(self.group), version)
+        if done is not None and int(done) == version:
+            return False
+        for users in self.iterUserChunks():
+            # prices held coins outside the top 200 into the snapshot
+            self.api.getPrices({coin for u in users for coin in u.portfolio})
+            self.revalue(users)
+        return True
+
+    def leaderboard(self, n: int = LEADERBOARD_SIZE):
+        rows = self.leaderboardRows(n)
+        if not rows:
             return "No leaderboard created yet. `crypto help` to start."
+        return getCryptoLeaderboardPng(rows)
 
-        prices = self.api.getPrices()
-
-        # sort users by total $, descending
-        sortedUsers = sorted(
-            users, key=lambda u: u.balance + u.value(prices), reverse=True
-        )
+    def leaderboardRows(self, n: int = LEADERBOARD_SIZE) -> List[Tuple]:
+        # (user, portfolio, coins $, balance $, total $, gain) of the top n
+        # by net worth, best first
+        self.revalueAll()
+        key = netWorthKey(self.group)
+        top = [name.decode("utf-8") for name in self.db.zrevrange(key, 0, n - 1)]
+        users = self._readUsers(top)
+        if not users:
+            return []
+        # revalued at the latest prices, in case a quote came in since
+        self._getPrices({coin for u in users for coin in u.portfolio})
+        values = self.revalue(users)
 
         rows = []
-        for user in sortedUsers:
+        for user, value in zip(users, values):
+            total = float(value) + user.balance
             rows.append(
                 (
                     user.user_name,
                     user.display_portfolio(),
-                    _format_money(user.value(prices)),
+                    _format_money(value),
                     _format_money(user.balance),
-                    _format_money(user.balance + user.value(prices)),
-                    (
-                        (user.balance + user.value(prices))
-                        - CryptoTrader.INITIAL_POT_SIZE
-                    ),
+                    _format_money(total),
+                    total - CryptoTrader.INITIAL_POT_SIZE,
                 )
             )
-
-        return getCryptoLeaderboardPng(rows)
+        # sort users by total $, descending
+        rows.sort(key=lambda row: -row[5])
+        return rows
 
 
 class Error(Exception):
@@ -477,8 +733,71 @@ class InvalidConditionError(Error):
     pass
 
 
+def userKey(group: str, kind: str, user_name: str) -> str:
+    # a user is kept in three hashes, so each change only touches its fields:
+    #   cryptoTrader.{group}.user.{user_name}      balance, if_id (last if id)
+    #   cryptoTrader.{group}.holdings.{user_name}  coin -> quantity
+    #   cryptoTrader.{group}.ifs.{user_name}       if id -> If json
+    return "cryptoTrader.{group}.{kind}.{user_name}".format(
+        group=group, kind=kind, user_name=user_name
+    )
+
+
+def usersKey(group: str) -> str:
+    # set of every user name in the group
+    return "cryptoTrader.{group}.users".format(group=group)
+
+
+def netWorthKey(group: str) -> str:
+    # sorted set of user name -> balance + coins at the latest prices
+    return "cryptoTrader.{group}.networth".format(group=group)
+
+
+def valuedKey(group: str) -> str:
+    # the snapshot (fetched_at_ms) the net worth set was last computed at
+    return "cryptoTrader.{group}.networth.valuedAt".format(group=group)
+
+
+def writeUser(pipe, group: str, user: User) -> None:
+    # queues commands replacing everything about the user
+    holdingsKey = userKey(group, "holdings", user.user_name)
+    ifsKey = userKey(group, "ifs", user.user_name)
+    pipe.delete(holdingsKey, ifsKey)
+    pipe.sadd(usersKey(group), user.user_name)
+    # ranked at the pot until revalueAll() next values the group
+    pipe.execute_command(
+        "ZADD", netWorthKey(group), "NX", CryptoTrader.INITIAL_POT_SIZE, user.user_name
+    )
+    pipe.hmset(
+        userKey(group, "user", user.user_name),
+        {"balance": repr(float(user.balance)), "if_id": user.get_next_if_id() - 1},
+    )
+    if user.portfolio:
+        pipe.hmset(holdingsKey, {c: repr(float(q)) for c, q in user.portfolio.items()})
+    if user.ifs:
+        pipe.hmset(ifsKey, {i.id: codec.encodeIf(i) for i in user.ifs})
+    book = TriggerBook(pipe, group)
+    for i in user.ifs:
+        book.add(user.user_name, i)
+
+
+def _parseQuantity(quantity: str, invalid: Error) -> Tuple[str, float]:
+    # ("pct", fraction of what there is) or ("qty", number of coins)
+    if quantity == "all" or quantity == "max":
+        quantity = "100%"
+    elif quantity == "half":
+        quantity = "50%"
+
+    if re.match("^\d+\.?\d*%$", quantity):
+        return "pct", max(0, min(100, float(quantity.strip("%")) / 100))
+    try:
+        return "qty", float(quantity)
+    except:
+        raise invalid
+
+
 def _format_money(n: float) -> str:
-    return "{0:.2f}".format(round(n,2))
+    return "{0:.2f}".format(round(n, 2))
 
 
 def _format_pct(n: float) -> str:
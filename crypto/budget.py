@@ -0,0 +1,108 @@
+from datetime import datetime, timedelta
+from redis import StrictRedis
+from typing import Optional
+import os
+import time
+
+# CoinMarketCap's basic plan allows about 300 credits a day
+CMC_DAILY_CREDITS = float(os.getenv("CMC_DAILY_CREDITS", 300))
+CREDITS_KEY = "crypto.credits.{day}"
+DEMAND_KEY = "crypto.demand"
+NEAREST_IF_KEY = "crypto.nearest_if"
+
+MIN_INTERVAL = 60.0  # CoinMarketCap itself only updates every minute
+MAX_INTERVAL = 30 * 60.0
+RESERVE = 0.05  # of the daily credits, kept for the end of the day
+ACTIVE_SECONDS = 15 * 60  # someone asked for prices this recently
+ACTIVE_FACTOR = 0.5
+IDLE_FACTOR = 2.0
+NEAR_DISTANCE = 0.02  # an armed if is within 2% of its price
+NEAR_FACTOR = 0.5
+CACHE_SECONDS = 10  # how long interval() is reused before asking redis again
+
+
+class CreditBudget:
+    # spreads the daily CoinMarketCap credits over the rest of the (UTC) day.
+    # credits spent are read from each response's status.credit_count and
+    # counted in redis, so every process sees the same budget. the even
+    # spend rate is then tightened while people are using the bot or an
+    # armed if is close to its price, and relaxed while nobody is; since the
+    # rate is recomputed from what is left, busy hours are paid for by
+    # quiet ones.
+
+    def __init__(self, db: StrictRedis, daily: float = CMC_DAILY_CREDITS) -> None:
+        self.db = db
+        self.daily = daily
+        self.creditsPerRefresh = 1.0
+        self._interval: Optional[float] = None
+        self._computedAt = 0.0
+        self._demandWrittenAt = 0.0
+
+    def spend(self, credits: Optional[float]) -> None:
+        credits = credits or 1.0
+        self.creditsPerRefresh = credits
+        key = CREDITS_KEY.format(day=_today())
+        pipe = self.db.pipeline()
+        pipe.incrbyfloat(key, credits)
+        pipe.expire(key, 2 * 24 * 60 * 60)
+        pipe.execute()
+        self._interval = None
+
+    def spent(self) -> float:
+        return float(self.db.get(CREDITS_KEY.format(day=_today())) or 0)
+
+    def remaining(self) -> float:
+        return max(0.0, self.daily - self.spent())
+
+    def demand(self) -> None:
+        # a user asked for prices; written at most every few seconds
+        now = time.time()
+        if now - self._demandWrittenAt > CACHE_SECONDS:
+            self._demandWrittenAt = now
+            self.db.set(DEMAND_KEY, now)
+
+    def nearestIf(self, distance: Optional[float]) -> None:
+        # relative distance between the closest armed if and its price
+        if distance is None:
+            self.db.delete(NEAREST_IF_KEY)
+        else:
+            self.db.set(NEAREST_IF_KEY, distance)
+        self._interval = None
+
+    def interval(self) -> float:
+        # seconds between refreshes
+        now = time.time()
+        if self._interval is None or now - self._computedAt > CACHE_SECONDS:
+            self._interval = self._compute(now)
+            self._computedAt = now
+        return self._interval
+
+    def _compute(self, now: float) -> float:
+        spent, lastDemand, nearest = self.db.mget(
+            CREDITS_KEY.format(day=_today()), DEMAND_KEY, NEAREST_IF_KEY
+        )
+        left = self.daily * (1 - RESERVE) - float(spent or 0)
+        secondsLeft = _secondsUntilTomorrow()
+        if left < self.creditsPerRefresh:
+            return secondsLeft + 1
+        even = secondsLeft / (left / self.creditsPerRefresh)
+        factor = 1.0
+        if lastDemand is not None and now - float(lastDemand) < ACTIVE_SECONDS:
+            factor *= ACTIVE_FACTOR
+        else:
+            factor *= IDLE_FACTOR
+        if nearest is not None and float(nearest) < NEAR_DISTANCE:
+            factor *= NEAR_FACTOR
+        return min(MAX_INTERVAL, max(MIN_INTERVAL, even * factor))
+
+
+def _today() -> str:
+    return datetime.utcnow().strftime("%Y-%m-%d")
+
+
+def _secondsUntilTomorrow() -> float:
+    now = datetime.utcnow()
+    tomorrow = (now + timedelta(days=1)).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+    return (tomorrow - now).total_seconds()
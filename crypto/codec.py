@@ -0,0 +1,115 @@
+from dataclasses import fields
+from json import JSONDecoder, JSONEncoder
+from operator import attrgetter
+from typing import Any, Callable, Dict, List, Sequence, Union
+
+# compact encoding of ifs (and whole users) for redis, in place of
+# dataclasses_json, which looks up type hints on every call.
+# an if is a flat json list, version first:
+#   [1, id, coin, comparator, price, action type, *action fields]
+#   [1,3,"btc","&gt;",20.0,"buy","eth","50%"]
+# a user is [1, user_name, balance, portfolio, [if lists without version]].
+# the dataclasses_json objects written before are still read.
+
+VERSION = 1
+
+_encode = JSONEncoder(separators=(",", ":")).encode
+_decode = JSONDecoder().decode
+
+
+class UserCodec:
+    # built once from the classes in crypto/CryptoTrader.py (see `codec`
+    # there); each action's fields are looked up here rather than per call
+
+    def __init__(
+        self, user: type, if_: type, condition: type, actions: Sequence[type]
+    ) -> None:
+        self.user = user
+        self.if_ = if_
+        self.condition = condition
+        # action type ("buy") -> class, and class -> its fields besides type
+        self.actions: Dict[str, type] = {}
+        self.encoders: Dict[type, Callable[[Any], List[Any]]] = {}
+        for cls in actions:
+            names = tuple(f.name for f in fields(cls) if f.name != "type")
+            self.actions[_typeOf(cls)] = cls
+            self.encoders[cls] = _encoder(attrgetter(*names), len(names))
+
+    def encodeIf(self, i: Any) -> str:
+        return _encode([VERSION, *self._ifValues(i)])
+
+    def decodeIf(self, data: Union[str, bytes]) -> Any:
+        values = _load(data)
+        if isinstance(values, dict):
+            return self._legacyIf(values)
+        _checkVersion(values[0])
+        return self._ifFrom(values, 1)
+
+    def encodeUser(self, user: Any) -> str:
+        return _encode(
+            [
+                VERSION,
+                user.user_name,
+                user.balance,
+                user.portfolio,
+                [self._ifValues(i) for i in user.ifs],
+            ]
+        )
+
+    def decodeUser(self, data: Union[str, bytes]) -> Any:
+        values = _load(data)
+        if isinstance(values, dict):
+            return self.user(
+                values["user_name"],
+                values["balance"],
+                values["portfolio"],
+                [self._legacyIf(i) for i in values.get("ifs") or []],
+            )
+        _checkVersion(values[0])
+        _, user_name, balance, portfolio, ifs = values
+        return self.user(
+            user_name, balance, portfolio, [self._ifFrom(i, 0) for i in ifs]
+        )
+
+    def _ifValues(self, i: Any) -> List[Any]:
+        c = i.condition
+        action = self.encoders[type(i.action)](i.action)
+        return [i.id, c.coin, c.comparator, c.price, *action]
+
+    def _ifFrom(self, values: List[Any], start: int) -> Any:
+        id, coin, comparator, price, kind = values[start : start + 5]
+        return self.if_(
+            id,
+            self.condition(coin, comparator, price),
+            self.actions[kind](*values[start + 5 :]),
+        )
+
+    def _legacyIf(self, i: Dict[str, Any]) -> Any:
+        # {"id": .., "condition": {..}, "action": {"type": .., ..}}
+        c = i["condition"]
+        action = dict(i["action"])
+        return self.if_(
+            i["id"],
+            self.condition(c["coin"], c["comparator"], c["price"]),
+            self.actions[action.pop("type")](**action),
+        )
+
+
+def _encoder(get: attrgetter, n: int) -> Callable[[Any], List[Any]]:
+    # attrgetter returns a single value, not a tuple, for one field
+    if n == 1:
+        return lambda action: [action.type, get(action)]
+    return lambda action: [action.type, *get(action)]
+
+
+def _typeOf(cls: type) -> str:
+    return next(f.default for f in fields(cls) if f.name == "type")
+
+
+def _load(data: Union[str, bytes]) -> Any:
+    return _decode(data if isinstance(data, str) else data.decode("utf-8"))
+
+
+def _checkVersion(version: Any) -> None:
+    if version != VERSION:
+        raise ValueError("unknown encoding version {}".format(version))
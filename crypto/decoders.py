@@ -1,18 +1,90 @@
+from dataclasses import MISSING, fields, is_dataclass
 from json import JSONDecoder
+from typing import Any, Callable, Dict, get_type_hints
 
+Converter = Callable[[Any], Any]
 
-class FastJsonDecoder(JSONDecoder):
-    def __init__(self, *args, **kwargs):
-        JSONDecoder.__init__(self, object_hook=self.hook, *args, **kwargs)
+new = object.__new__
 
-    def jsonToClass(self):
-        raise NotImplementedError("jsonToClass() must be implemented on a subclass")
 
-    def hook(self, obj):
-        for keys, C in self.jsonToClass().items():
-            if set(keys) == set(obj.keys()):
-                args = []
-                for key in list(keys):
-                    args.append(obj[key])
-                return C(*args)
-        return obj
+class SchemaDecoder(JSONDecoder):
+    # decodes into plain dicts with json's C scanner, then builds `root` and
+    # every dataclass below it in one pass, following their type hints.
+    # the converters are compiled once per type: unknown keys are ignored and
+    # missing ones get the field's default (or None), so a new field in the
+    # API response doesn't stop us from building the classes.
+
+    root: Any = None
+
+    def decode(self, s, *args, **kwargs):
+        return compileDecoder(self.root)(super().decode(s, *args, **kwargs))
+
+
+_compiled: Dict[Any, Converter] = {}
+
+
+def compileDecoder(t: Any) -> Converter:
+    if t not in _compiled:
+        _compiled[t] = _compile(t)
+    return _compiled[t]
+
+
+def _compile(t: Any) -> Converter:
+    if is_dataclass(t):
+        return _compileDataclass(t)
+    origin = getattr(t, "__origin__", None)
+    if origin is list:
+        item = compileDecoder(t.__args__[0])
+        if item is _identity:
+            return _identity
+        return lambda v: [item(x) for x in v] if isinstance(v, list) else v
+    if origin is dict:
+        value = compileDecoder(t.__args__[1])
+        if value is _identity:
+            return _identity
+        return lambda v: (
+            {k: value(x) for k, x in v.items()} if isinstance(v, dict) else v
+        )
+    return _identity
+
+
+def _compileDataclass(cls: Any) -> Converter:
+    hints = get_type_hints(cls)
+    spec = [
+        (
+            f.name,
+            None if f.default is MISSING else f.default,
+            _orNone(compileDecoder(hints[f.name])),
+        )
+        for f in fields(cls)
+    ]
+
+    if hasattr(cls, "__post_init__"):
+        return lambda obj: cls(**_values(obj, spec)) if isinstance(obj, dict) else obj
+
+    def build(obj):
+        # fills __dict__ directly, a frozen dataclass' __init__ costs a
+        # object.__setattr__ call per field
+        if not isinstance(obj, dict):
+            return obj
+        instance = new(cls)
+        instance.__dict__.update(_values(obj, spec))
+        return instance
+
+    return build
+
+
+def _values(obj: Dict, spec) -> Dict:
+    get = obj.get
+    return {
+        name: get(name, default) if convert is None else convert(get(name, default))
+        for name, default, convert in spec
+    }
+
+
+def _orNone(convert: Converter):
+    return None if convert is _identity else convert
+
+
+def _identity(v: Any) -> Any:
+    return v
@@ -0,0 +1,183 @@
+from .budget import MIN_INTERVAL
+from array import array
+from redis import StrictRedis
+from typing import Dict, Iterator, Mapping, Optional, Sequence, Tuple
+import numpy as np
+import time
+
+HISTORY_KEY = "crypto.history"  # every ring in one hash, as saved before
+COINS_KEY = "crypto.history.coins"
+COIN_KEY = "crypto.history.coin.{coin}"
+HISTORY_SECONDS = 12 * 60 * 60
+# samples kept per coin: 12 hours at the fastest the budget ever polls, longer
+# when it polls less often
+HISTORY_SIZE = int(HISTORY_SECONDS / MIN_INTERVAL)
+SAMPLE_BYTES = 16  # a time and a price, as doubles
+
+
+class PriceHistory:
+    # the last HISTORY_SIZE (time, price) samples of every coin, one ring
+    # buffer per coin backed by two array('d') columns.
+    # appends are O(1) and window queries only touch the samples in the
+    # window. save() / load() keep the history in redis so it survives
+    # restarts: a string of packed samples per coin, that save() only APPENDs
+    # the samples recorded since to. strings are cut back to the ring's size
+    # on load, or once they grow to twice that.
+
+    def __init__(self, db: StrictRedis, size: int = HISTORY_SIZE) -> None:
+        self.db = db
+        self.size = size
+        self._rings: Dict[str, _Ring] = {}
+        self._unsaved: Dict[str, array] = {}
+
+    def record(self, prices: Mapping[str, float], t: Optional[float] = None) -> None:
+        t = time.time() if t is None else t
+        for coin, price in prices.items():
+            ring = self._rings.get(coin)
+            if ring is None:
+                ring = self._rings[coin] = _Ring(self.size)
+            ring.append(t, price)
+            self._unsaved.setdefault(coin, array("d")).extend((t, price))
+
+    def change(self, coin: str, seconds: float) -> Optional[float]:
+        # relative change from the price as of `seconds` ago (or the oldest
+        # sample, if we don't go back that far) to the latest price
+        ring = self._rings.get(coin)
+        if ring is None or ring.count < 2:
+            return None
+        since = ring.latestTime() - seconds
+        base = None
+        for t, price in ring.newestFirst():
+            base = price
+            if t <= since:
+                break
+        if not base:
+            return None
+        return ring.latestPrice() / base - 1
+
+    def changes(self, coins: Sequence[str], seconds: float) -> np.ndarray:
+        # change() of each coin, nan where there is none; in a table's row
+        # order, for ListingsTable.screen
+        changes = (self.change(coin, seconds) for coin in coins)
+        return np.array([np.nan if c is None else c for c in changes], dtype=np.float64)
+
+    def low(self, coin: str, seconds: float) -> Optional[float]:
+        prices = self._window(coin, seconds)
+        return min(prices) if prices else None
+
+    def high(self, coin: str, seconds: float) -> Optional[float]:
+        prices = self._window(coin, seconds)
+        return max(prices) if prices else None
+
+    def save(self) -> None:
+        if not self._unsaved:
+            return
+        coins = list(self._unsaved)
+        pipe = self.db.pipeline(transaction=False)
+        pipe.sadd(COINS_KEY, *coins)
+        for coin in coins:
+            pipe.append(COIN_KEY.format(coin=coin), self._unsaved[coin].tobytes())
+        lengths = pipe.execute()[1:]
+        self._unsaved = {}
+        limit = 2 * self.size * SAMPLE_BYTES
+        self._rewrite([c for c, n in zip(coins, lengths) if n > limit])
+
+    def load(self) -> None:
+        coins = [coin.decode() for coin in self.db.smembers(COINS_KEY)]
+        pipe = self.db.pipeline(transaction=False)
+        for coin in coins:
+            pipe.get(COIN_KEY.format(coin=coin))
+        long = []
+        for coin, packed in zip(coins, pipe.execute()):
+            if packed:
+                self._rings[coin] = _Ring.unpack(self.size, packed)
+                if len(packed) > self.size * SAMPLE_BYTES:
+                    long.append(coin)
+        # move a history saved as one hash over
+        legacy = self.db.hgetall(HISTORY_KEY)
+        for coin, packed in legacy.items():
+            coin = coin.decode()
+            if coin not in self._rings:
+                self._rings[coin] = _Ring.unpackColumns(self.size, packed)
+                long.append(coin)
+        self._rewrite(long)
+        if legacy:
+            self.db.delete(HISTORY_KEY)
+
+    def _rewrite(self, coins: Sequence[str]) -> None:
+        # replaces the coins' strings with just what their rings hold
+        if not coins:
+            return
+        pipe = self.db.pipeline(transaction=False)
+        pipe.sadd(COINS_KEY, *coins)
+        for coin in coins:
+            pipe.set(COIN_KEY.format(coin=coin), self._rings[coin].pack())
+        pipe.execute()
+
+    def _window(self, coin: str, seconds: float):
+        ring = self._rings.get(coin)
+        if ring is None or ring.count == 0:
+            return []
+        since = ring.latestTime() - seconds
+        prices = []
+        for t, price in ring.newestFirst():
+            if t < since:
+                break
+            prices.append(price)
+        return prices
+
+
+class _Ring:
+    __slots__ = ("times", "prices", "next", "count")
+
+    def __init__(self, size: int) -> None:
+        self.times = array("d", bytes(8 * size))
+        self.prices = array("d", bytes(8 * size))
+        self.next = 0  # where the next sample goes
+        self.count = 0
+
+    def append(self, t: float, price: float) -> None:
+        self.times[self.next] = t
+        self.prices[self.next] = price
+        self.next = (self.next + 1) % len(self.times)
+        self.count = min(self.count + 1, len(self.times))
+
+    def latestTime(self) -> float:
+        return self.times[self.next - 1]
+
+    def latestPrice(self) -> float:
+        return self.prices[self.next - 1]
+
+    def newestFirst(self) -> Iterator[Tuple[float, float]]:
+        i = self.next
+        for _ in range(self.count):
+            i -= 1  # index -1 wraps around to the end of the array
+            yield self.times[i], self.prices[i]
+            if i < 0:
+                i += len(self.times)
+
+    def pack(self) -> bytes:
+        # oldest first, each sample's time then its price
+        samples = array("d")
+        for t, price in reversed(list(self.newestFirst())):
+            samples.extend((t, price))
+        return samples.tobytes()
+
+    @staticmethod
+    def unpack(size: int, packed: bytes) -> "_Ring":
+        # keeps the last `size` samples; a torn trailing sample is dropped
+        ring = _Ring(size)
+        samples = array("d", packed[: len(packed) // SAMPLE_BYTES * SAMPLE_BYTES])
+        for n in range(max(0, len(samples) // 2 - size) * 2, len(samples), 2):
+            ring.append(samples[n], samples[n + 1])
+        return ring
+
+    @staticmethod
+    def unpackColumns(size: int, packed: bytes) -> "_Ring":
+        # the hash's format: all the times, then all the prices
+        ring = _Ring(size)
+        samples = array("d", packed)
+        n = len(samples) // 2
+        for t, price in zip(samples[max(0, n - size) : n], samples[n:][-size:]):
+            ring.append(t, price)
+        return ring
@@ -1,6 +1,8 @@
 from dataclasses import dataclass
-from typing import Dict, List
-from .decoders import FastJsonDecoder
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+from .decoders import SchemaDecoder
+from .table import ListingsTable
 
 # -- CoinMarketCap Listings API -- #
 # https://pro-api.coinmarketcap.com/v1/cryptocurrency/listings/latest
@@ -50,40 +52,83 @@ class Listings:
     data: List[Listing]
 
 
-class ListingsDecoder(FastJsonDecoder):
-    def jsonToClass(self):
-        return {
-            (
-                "timestamp",
-                "error_code",
-                "error_message",
-                "elapsed",
-                "credit_count",
-            ): Status,
-            (
-                "id",
-                "name",
-                "symbol",
-                "slug",
-                "circulating_supply",
-                "total_supply",
-                "max_supply",
-                "date_added",
-                "num_market_pairs",
-                "tags",
-                "platform",
-                "cmc_rank",
-                "last_updated",
-                "quote",
-            ): Listing,
-            (
-                "price",
-                "volume_24h",
-                "percent_change_1h",
-                "percent_change_24h",
-                "percent_change_7d",
-                "market_cap",
-                "last_updated",
-            ): Quote,
-            ("status", "data"): Listings,
-        }
+@dataclass(frozen=True)
+class Snapshot:
+    # one decoded listings response plus the lookups we need from it,
+    # built once per cache refresh and shared by every reader until the next
+    listings: Listings
+    prices: Mapping[str, float]  # lowercase symbol -> USD price
+    ranked: Tuple[Listing, ...]  # by cmc_rank, ascending
+    table: ListingsTable  # ranked, as columns
+    fetched_at_ms: int
+    # coins fetched through quotes/latest since, and when, by lowercase symbol
+    quoted: Tuple[Listing, ...] = ()
+    quoted_at: Mapping[str, int] = MappingProxyType({})
+
+    @staticmethod
+    def of(
+        listings: Listings,
+        fetched_at_ms: int,
+        quoted: Sequence[Listing] = (),
+        quoted_at: Mapping[str, int] = MappingProxyType({}),
+    ) -> "Snapshot":
+        replaced = {l.symbol.lower() for l in quoted}
+        coins = [l for l in listings.data if l.symbol.lower() not in replaced]
+        ranked = tuple(sorted(coins + list(quoted), key=_rank))
+        table = ListingsTable(ranked)
+        prices = table.price.tolist()
+        return Snapshot(
+            listings,
+            MappingProxyType({s: prices[row] for s, row in table.index.items()}),
+            ranked,
+            table,
+            fetched_at_ms,
+            tuple(quoted),
+            MappingProxyType(dict(quoted_at)),
+        )
+
+    def pricedAt(self, symbol: str) -> Optional[int]:
+        # when symbol's price was fetched, None if we don't have one
+        if symbol not in self.prices:
+            return None
+        return self.quoted_at.get(symbol, self.fetched_at_ms)
+
+    def listed(self, symbol: str) -> bool:
+        # whether symbol comes with every listings/latest fetch
+        return any(l.symbol.lower() == symbol for l in self.listings.data)
+
+    def withQuotes(self, quotes: Sequence[Listing], at_ms: int) -> "Snapshot":
+        fresh = {l.symbol.lower() for l in quotes}
+        quoted = [l for l in self.quoted if l.symbol.lower() not in fresh]
+        quoted_at = dict(self.quoted_at)
+        quoted_at.update({symbol: at_ms for symbol in fresh})
+        return Snapshot.of(
+            self.listings, self.fetched_at_ms, quoted + list(quotes), quoted_at
+        )
+
+    def withListings(self, listings: Listings, fetched_at_ms: int) -> "Snapshot":
+        # a newer listings fetch, keeping the quoted coins it doesn't list
+        listed = {l.symbol.lower() for l in listings.data}
+        quoted = [l for l in self.quoted if l.symbol.lower() not in listed]
+        quoted_at = {l.symbol.lower(): self.quoted_at[l.symbol.lower()] for l in quoted}
+        return Snapshot.of(listings, fetched_at_ms, quoted, quoted_at)
+
+
+@dataclass(frozen=True)
+class Quotes:
+    # cryptocurrency/quotes/latest, by symbol
+    status: Status
+    data: Dict[str, Listing]
+
+
+def _rank(listing: Listing) -> int:
+    # coins CoinMarketCap doesn't rank go last
+    return listing.cmc_rank if listing.cmc_rank is not None else 1 << 62
+
+
+class ListingsDecoder(SchemaDecoder):
+    root = Listings
+
+
+class QuotesDecoder(SchemaDecoder):
+    root = Quotes
@@ -0,0 +1,146 @@
+from dataclasses import asdict
+from json import dumps, loads
+from redis import StrictRedis
+from threading import Lock, Thread
+from typing import Dict, Optional
+from .decoders import compileDecoder
+from .models import Listing, ListingsDecoder, Snapshot
+import os
+import time
+
+SNAPSHOT_KEY = "crypto.snapshot"
+QUOTES_KEY = "crypto.snapshot.quotes"
+VERSION_KEY = "crypto.snapshot.version"
+STORED_VERSION_KEY = "crypto.snapshot.stored"
+LOCK_KEY = "crypto.snapshot.lock"
+CHANNEL = "crypto.snapshot"
+LOCK_SECONDS = 30
+RESUBSCRIBE_SECONDS = 5
+
+
+class SnapshotStore:
+    # the latest listings snapshot (and the coins quoted on top of it), shared
+    # by every bot process through redis.
+    # whoever wins claim() fetches from CoinMarketCap and put()s the raw
+    # response under a new version and publishes that version; every other
+    # process decodes it once when the notification arrives and then reads
+    # its local copy, without a round trip to redis or CoinMarketCap.
+
+    def __init__(self, db: StrictRedis) -> None:
+        self.db = db
+        self._local: Optional[Snapshot] = None
+        self._version = 0
+        self._lock = Lock()
+        self._pid = None
+
+    def latest(self, max_age_ms: Optional[int] = None) -> Optional[Snapshot]:
+        # the local copy, reloaded from redis if it is older than max_age_ms
+        # (in case a notification was missed)
+        self._ensureSubscribed()
+        local = self._local
+        if local is None or (max_age_ms is not None and _ageMs(local) > max_age_ms):
+            self._reload()
+        return self._local
+
+    def claim(self) -> bool:
+        # True if this process should fetch the next snapshot
+        return bool(self.db.set(LOCK_KEY, os.getpid(), ex=LOCK_SECONDS, nx=True))
+
+    def put(self, body: str, snapshot: Snapshot) -> int:
+        # stores the raw listings response the snapshot was decoded from,
+        # and its quoted coins
+        return self._put(
+            snapshot,
+            {
+                SNAPSHOT_KEY: dumps(
+                    {"fetched_at_ms": snapshot.fetched_at_ms, "body": body}
+                ),
+                QUOTES_KEY: _dumpQuotes(snapshot),
+            },
+        )
+
+    def putQuotes(self, snapshot: Snapshot) -> int:
+        # new quoted coins on top of the stored listings
+        return self._put(snapshot, {QUOTES_KEY: _dumpQuotes(snapshot)})
+
+    def _put(self, snapshot: Snapshot, values: Dict[str, str]) -> int:
+        version = self.db.incr(VERSION_KEY)
+        pipe = self.db.pipeline()
+        for key, value in values.items():
+            pipe.set(key, value)
+        pipe.set(STORED_VERSION_KEY, version)
+        pipe.publish(CHANNEL, version)
+        if SNAPSHOT_KEY in values:
+            pipe.delete(LOCK_KEY)
+        pipe.execute()
+        self._swap(version, snapshot)
+        return version
+
+    def _reload(self) -> None:
+        # checks the (small) version before fetching the (large) snapshot
+        version = self.db.get(VERSION_KEY)
+        if version is None or int(version) <= self._version:
+            return
+        pipe = self.db.pipeline()
+        pipe.get(STORED_VERSION_KEY)
+        pipe.get(SNAPSHOT_KEY)
+        pipe.get(QUOTES_KEY)
+        stored, rawListings, rawQuotes = pipe.execute()
+        if stored is None or rawListings is None or int(stored) <= self._version:
+            return
+        listings = loads(rawListings)
+        local = self._local
+        if local is not None and local.fetched_at_ms == listings["fetched_at_ms"]:
+            decoded = local.listings  # only the quotes changed
+        else:
+            decoded = loads(listings["body"], cls=ListingsDecoder)
+        quotes = loads(rawQuotes) if rawQuotes else {"quoted": [], "quoted_at": {}}
+        self._swap(
+            int(stored),
+            Snapshot.of(
+                decoded,
+                listings["fetched_at_ms"],
+                [compileDecoder(Listing)(l) for l in quotes["quoted"]],
+                quotes["quoted_at"],
+            ),
+        )
+
+    def _swap(self, version: int, snapshot: Snapshot) -> None:
+        with self._lock:
+            if version > self._version:
+                self._version = version
+                self._local = snapshot
+
+    def _ensureSubscribed(self) -> None:
+        # threads don't survive a fork, so subscribe from whichever process
+        # first reads a snapshot
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        Thread(target=self._subscribe, daemon=True).start()
+
+    def _subscribe(self) -> None:
+        while True:
+            try:
+                pubsub = self.db.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(CHANNEL)
+                for message in pubsub.listen():
+                    if int(message["data"]) > self._version:
+                        self._reload()
+            except Exception as e:
+                print("snapshot subscription failed: {e}".format(e=e))
+                time.sleep(RESUBSCRIBE_SECONDS)
+
+
+def _dumpQuotes(snapshot: Snapshot) -> str:
+    return dumps(
+        {
+            "quoted": [asdict(l) for l in snapshot.quoted],
+            "quoted_at": dict(snapshot.quoted_at),
+        }
+    )
+
+
+def _ageMs(snapshot: Snapshot) -> int:
+    return int(time.time() * 1000) - snapshot.fetched_at_ms
@@ -0,0 +1,151 @@
+from bisect import bisect_right
+from datetime import datetime
+from json import loads
+from typing import Callable, Iterable, List, Mapping, Optional, Tuple
+from .models import Listing, Listings, ListingsDecoder, Quote, Snapshot, Status
+import os
+import time
+
+
+class PriceSource:
+    # where CryptoTrader gets its prices from: CoinMarketCapApi, or a
+    # ReplayPriceSource for offline runs. subclasses implement getSnapshot()
+
+    def getSnapshot(self) -> Snapshot:
+        raise NotImplementedError("getSnapshot() must be implemented on a subclass")
+
+    def getFreshSnapshot(self) -> Snapshot:
+        # like getSnapshot(), but never an expired snapshot kept around while
+        # a newer one is fetched; for the poll, which acts on the prices
+        return self.getSnapshot()
+
+    def getListings(self) -> Listings:
+        return self.getSnapshot().listings
+
+    def getPrices(self, symbols: Optional[Iterable[str]] = None) -> Mapping[str, float]:
+        # read-only, shared by every caller until the next refresh
+        return self.getSnapshot().prices
+
+    def getTopNListings(self, n: int) -> List[Listing]:
+        snapshot = self.getSnapshot()
+        return [snapshot.ranked[row] for row in snapshot.table.top(n)]
+
+
+class ReplayPriceSource(PriceSource):
+    # replays a recorded market, without a network or an API key.
+    # path is either a directory of listings/latest responses (as written
+    # with CMC_RECORD_DIR, one <fetched at ms>.json per fetch) or a price
+    # history file with one {"t": seconds, "prices": {"btc": ...}} per line.
+    # the recording plays back `speed` times faster than it was recorded;
+    # with speed=None it only moves on when advance() is called.
+
+    def __init__(
+        self,
+        path: str,
+        speed: Optional[float] = 1.0,
+        loop: bool = False,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.speed = speed
+        self.loop = loop
+        self.clock = clock
+        self._frames = (
+            _directoryFrames(path) if os.path.isdir(path) else _fileFrames(path)
+        )
+        if not self._frames:
+            raise ValueError("no recorded prices in {path}".format(path=path))
+        self._frames.sort(key=lambda f: f[0])
+        self._times = [t for t, _ in self._frames]
+        self._position = 0
+        self._started = clock()
+        self._cached: Tuple[int, Optional[Snapshot]] = (-1, None)
+
+    def getSnapshot(self) -> Snapshot:
+        position = self._frame()
+        if self._cached[0] != position:
+            self._cached = (position, self._frames[position][1]())
+        return self._cached[1]  # type: ignore
+
+    def advance(self) -> bool:
+        # steps to the next recorded snapshot, False at the end of the recording
+        if self._position + 1 < len(self._frames):
+            self._position += 1
+            return True
+        if self.loop:
+            self._position = 0
+            return True
+        return False
+
+    def _frame(self) -> int:
+        if self.speed is None:
+            return self._position
+        elapsed = (self.clock() - self._started) * self.speed
+        span = self._times[-1] - self._times[0]
+        if self.loop and span > 0:
+            elapsed %= span
+        return max(0, bisect_right(self._times, self._times[0] + elapsed) - 1)
+
+
+def snapshotOf(prices: Mapping[str, float], t: float) -> Snapshot:
+    # a snapshot with nothing but prices, ranked in the order given
+    data = [
+        Listing(
+            rank,
+            symbol.upper(),
+            symbol.upper(),
+            symbol.lower(),
+            0,
+            0,
+            0,
+            "",
+            0,
+            [],
+            "",
+            rank,
+            "",
+            {"USD": Quote(price, 0.0, 0.0, 0.0, 0.0, 0.0, "")},
+        )
+        for rank, (symbol, price) in enumerate(prices.items(), 1)
+    ]
+    return Snapshot.of(Listings(Status("", 0, "", 0, 0), data), int(t * 1000))
+
+
+def _directoryFrames(path: str) -> List[Tuple[float, Callable[[], Snapshot]]]:
+    frames = []
+    for name in sorted(os.listdir(path)):
+        if not name.endswith(".json"):
+            continue
+        file = os.path.join(path, name)
+        stem = name[: -len(".json")]
+        if stem.isdigit():
+            t = int(stem) / 1000
+        else:
+            t = _parseTimestamp(_read(file).status.timestamp)
+        frames.append((t, _loader(file, t)))
+    return frames
+
+
+def _fileFrames(path: str) -> List[Tuple[float, Callable[[], Snapshot]]]:
+    frames = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                tick = loads(line)
+                t, prices = float(tick["t"]), tick["prices"]
+                frames.append((t, lambda p=prices, t=t: snapshotOf(p, t)))
+    return frames
+
+
+def _loader(file: str, t: float) -> Callable[[], Snapshot]:
+    return lambda: Snapshot.of(_read(file), int(t * 1000))
+
+
+def _read(file: str) -> Listings:
+    with open(file) as f:
+        return loads(f.read(), cls=ListingsDecoder)
+
+
+def _parseTimestamp(timestamp: str) -> float:
+    return (
+        datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%S.%fZ") - datetime(1970, 1, 1)
+    ).total_seconds()
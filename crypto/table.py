@@ -0,0 +1,84 @@
+from typing import Dict, List, Mapping, Sequence, Tuple, Union
+import numpy as np
+
+COLUMNS = (
+    "price",
+    "volume_24h",
+    "market_cap",
+    "percent_change_1h",
+    "percent_change_24h",
+    "percent_change_7d",
+)
+
+
+class ListingsTable:
+    # a snapshot's listings as numpy columns, one row per listing in rank
+    # order, plus a symbol -> row index. built once per snapshot, so top N,
+    # percent change screens and valuing every portfolio are array operations.
+
+    def __init__(self, ranked: Sequence) -> None:
+        self.symbols: List[str] = [l.symbol.lower() for l in ranked]
+        # a few symbols are used by more than one coin, the best ranked wins
+        self.index: Dict[str, int] = {}
+        for row, symbol in enumerate(self.symbols):
+            self.index.setdefault(symbol, row)
+        self.rank = np.array([l.cmc_rank or 0 for l in ranked], dtype=np.int64)
+        quotes = [l.quote["USD"] for l in ranked]
+        self.columns: Dict[str, np.ndarray] = {
+            name: np.array([getattr(q, name) or 0.0 for q in quotes], dtype=np.float64)
+            for name in COLUMNS
+        }
+
+    @property
+    def price(self) -> np.ndarray:
+        return self.columns["price"]
+
+    def top(self, n: int) -> np.ndarray:
+        # rows of the n best ranked listings
+        return np.arange(min(n, len(self.symbols)))
+
+    def screen(
+        self, column: Union[str, np.ndarray], threshold: float
+    ) -> List[Tuple[str, float]]:
+        # listings whose column (by name, or values in row order, nan for
+        # none) moved at least threshold either way, biggest move first
+        values = self.columns[column] if isinstance(column, str) else column
+        rows = np.nonzero(np.abs(np.nan_to_num(values)) >= threshold)[0]
+        rows = rows[np.argsort(-np.abs(values[rows]))]
+        return [(self.symbols[r], float(values[r])) for r in rows]
+
+    def rows(self, symbols: Sequence[str]) -> np.ndarray:
+        # row of each symbol, -1 for symbols not in the table
+        index = self.index
+        return np.array([index.get(s, -1) for s in symbols], dtype=np.int64)
+
+    def values(self, holdings: "Holdings") -> np.ndarray:
+        # value of every holder's coins at this table's prices
+        rows = self.rows(holdings.symbols)
+        prices = np.where(rows >= 0, self.price[rows], 0.0)
+        return np.bincount(
+            holdings.owners,
+            weights=prices[holdings.codes] * holdings.quantities,
+            minlength=holdings.n,
+        ).astype(np.float64, copy=False)
+
+
+class Holdings:
+    # everybody's portfolio as flat columns: owner, coin and quantity of each
+    # holding, coins coded as positions in `symbols` so they are looked up
+    # once per coin instead of once per holding
+    def __init__(self, portfolios: Sequence[Mapping[str, float]]) -> None:
+        codes: Dict[str, int] = {}
+        owners: List[int] = []
+        coins: List[int] = []
+        quantities: List[float] = []
+        for owner, portfolio in enumerate(portfolios):
+            for symbol, quantity in portfolio.items():
+                owners.append(owner)
+                coins.append(codes.setdefault(symbol, len(codes)))
+                quantities.append(quantity)
+        self.n = len(portfolios)
+        self.symbols: List[str] = list(codes.keys())
+        self.owners = np.array(owners, dtype=np.int64)
+        self.codes = np.array(coins, dtype=np.int64)
+        self.quantities = np.array(quantities, dtype=np.float64)
@@ -0,0 +1,100 @@
+from redis import StrictRedis
+from typing import Any, List, Mapping, Optional, Set, Tuple
+
+# comparator as written in slack -> which side of the book
+SIDES = {"&gt;": "gt", "&lt;": "lt"}
+
+
+class TriggerBook:
+    # every armed if, indexed by price: for each coin a sorted set of the
+    # thresholds of its > ifs and one of its < ifs, members "{if id}:{user}".
+    # on a price tick, a range query on each side (a skip list walk, O(log n)
+    # plus what it returns) finds exactly the ifs that price crossed, so the
+    # poll doesn't have to go through everybody's ifs.
+    #   cryptoTrader.{group}.triggers               coins with a trigger
+    #   cryptoTrader.{group}.triggers.{coin}.gt|lt  member -> if price
+
+    def __init__(self, db: StrictRedis, group: str) -> None:
+        self.db = db
+        self.group = group
+
+    def add(self, user_name: str, i: Any, pipe: Optional[StrictRedis] = None) -> None:
+        # i is a crypto.CryptoTrader.If; queued on pipe if given
+        key = self._key(i)
+        if key is not None:
+            db = pipe if pipe is not None else self.db
+            # not zadd(): its argument order differs between redis.from_url's
+            # legacy Redis client and StrictRedis
+            db.execute_command("ZADD", key, i.condition.price, _member(user_name, i.id))
+            db.sadd(self._coinsKey(), i.condition.coin)
+
+    def remove(
+        self, user_name: str, i: Any, pipe: Optional[StrictRedis] = None
+    ) -> None:
+        key = self._key(i)
+        if key is not None:
+            db = pipe if pipe is not None else self.db
+            db.zrem(key, _member(user_name, i.id))
+
+    def discard(
+        self, key: str, user_name: str, id: int, pipe: Optional[StrictRedis] = None
+    ) -> None:
+        # a member returned by crossed() whose if is gone
+        (pipe if pipe is not None else self.db).zrem(key, _member(user_name, id))
+
+    def coins(self) -> Set[str]:
+        # the coins with an armed if, which the poll needs prices for
+        return {c.decode("utf-8") for c in self.db.smembers(self._coinsKey())}
+
+    def crossed(
+        self, prices: Mapping[str, float]
+    ) -> Tuple[List[Tuple[str, int, str]], Optional[float]]:
+        # (user, if id, key) of each if whose condition the prices meet, and
+        # how far the closest if that isn't met yet is from its price,
+        # relative to it. one round trip for the coins, one for every query
+        coins = [c for c in self.coins() if c in prices]
+        pipe = self.db.pipeline(transaction=False)
+        for coin in coins:
+            price = repr(float(prices[coin]))
+            gt, lt = self._sideKey(coin, "gt"), self._sideKey(coin, "lt")
+            # coin > threshold: thresholds below the price fired, the
+            # lowest one at or above it is the closest
+            pipe.zrangebyscore(gt, "-inf", "(" + price)
+            pipe.zrangebyscore(gt, price, "+inf", start=0, num=1, withscores=True)
+            # coin < threshold: the other way around
+            pipe.zrangebyscore(lt, "(" + price, "+inf")
+            pipe.zrevrangebyscore(lt, price, "-inf", start=0, num=1, withscores=True)
+        replies = pipe.execute()
+
+        fired: List[Tuple[str, int, str]] = []
+        nearest: Optional[float] = None
+        for n, coin in enumerate(coins):
+            gtFired, gtNext, ltFired, ltNext = replies[4 * n : 4 * n + 4]
+            gt, lt = self._sideKey(coin, "gt"), self._sideKey(coin, "lt")
+            for key, members in ((gt, gtFired), (lt, ltFired)):
+                for member in members:
+                    id, _, user_name = member.decode("utf-8").partition(":")
+                    fired.append((user_name, int(id), key))
+            for _, threshold in gtNext + ltNext:
+                if threshold:
+                    distance = abs(prices[coin] - threshold) / threshold
+                    if nearest is None or distance < nearest:
+                        nearest = distance
+        return fired, nearest
+
+    def _key(self, i: Any) -> Optional[str]:
+        side = SIDES.get(i.condition.comparator)
+        return None if side is None else self._sideKey(i.condition.coin, side)
+
+    def _sideKey(self, coin: str, side: str) -> str:
+        return "cryptoTrader.{group}.triggers.{coin}.{side}".format(
+            group=self.group, coin=coin, side=side
+        )
+
+    def _coinsKey(self) -> str:
+        return "cryptoTrader.{group}.triggers".format(group=self.group)
+
+
+def _member(user_name: str, id: int) -> str:
+    # the id first: user names can have a ':' in them
+    return "{id}:{user_name}".format(id=id, user_name=user_name)
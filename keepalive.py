@@ -1,7 +1,7 @@
 import os, requests, logging
 
 hostname = os.environ["PING_URL"]
-response = requests.get(hostname)
+response = requests.get(hostname, timeout=10)
 status = response.status_code
 
 if status == 200:
@@ -3,13 +3,22 @@ import pickle
 from bot.redis import redis
 import unicodedata
 from datetime import datetime
-from crypto.CryptoTrader import User
+from crypto.CryptoTrader import (
+    CryptoTrader,
+    User,
+    codec,
+    netWorthKey,
+    usersKey,
+    valuedKey,
+    writeUser,
+)
+from crypto.triggers import TriggerBook
 from typing import Dict, List
 
 
 def get_users(prefix: str) -> List[User]:
     return [
-        User.from_json(redis.get(account))
+        codec.decodeUser(redis.get(account))  # type: ignore
         for account in redis.keys("{}.*".format(prefix))
     ]
 
@@ -19,7 +28,78 @@ def get_ifs(prefix: str):
         print(user.ifs)
 
 
-get_ifs("cryptoTrader.test.json")
+def migrate_to_hashes(batch: int = 500) -> None:
+    # cryptoTrader.{group}.json.{user} blobs -> the per-user hashes described
+    # at crypto.CryptoTrader.userKey. keys are found with SCAN and moved a
+    # batch at a time; the blob is deleted as its hashes are written, so the
+    # migration can be stopped and run again. the Procfile's release phase
+    # runs this file on every deploy
+    moved = 0
+    keys = []
+    for key in redis.scan_iter(match="cryptoTrader.*.json.*", count=batch):
+        keys.append(key)
+        if len(keys) == batch:
+            moved += migrate_batch(keys)
+            keys = []
+    if keys:
+        moved += migrate_batch(keys)
+    print("moved {} users to hashes".format(moved))
+
+
+def migrate_batch(keys: List[bytes]) -> int:
+    pipe = redis.pipeline()
+    moved = 0
+    for key, saved in zip(keys, redis.mget(keys)):
+        if saved is None:
+            continue  # deleted since the scan
+        prefix = key.decode("utf-8").partition(".json.")[0]
+        group = prefix[len("cryptoTrader.") :]
+        writeUser(pipe, group, codec.decodeUser(saved))  # type: ignore
+        pipe.delete(key)
+        pipe.delete(valuedKey(group))  # so the next revalueAll() values them
+        moved += 1
+    pipe.execute()
+    return moved
+
+
+def index_users(batch: int = 500) -> None:
+    # adds users stored as hashes before there was a users set to it, and
+    # to the net worth set, at the pot until revalueAll() values them
+    indexed = 0
+    pot = CryptoTrader.INITIAL_POT_SIZE
+    pipe = redis.pipeline(transaction=False)
+    for key in redis.scan_iter(match="cryptoTrader.*.user.*", count=batch):
+        prefix, _, user_name = key.decode("utf-8").partition(".user.")
+        group = prefix[len("cryptoTrader.") :]
+        pipe.sadd(usersKey(group), user_name)
+        pipe.execute_command("ZADD", netWorthKey(group), "NX", pot, user_name)
+        indexed += 1
+        if indexed % batch == 0:
+            pipe.execute()
+    pipe.execute()
+    print("indexed {} users".format(indexed))
+
+
+def index_triggers(batch: int = 500) -> None:
+    # adds ifs stored before there was a trigger book to it
+    indexed = 0
+    pipe = redis.pipeline(transaction=False)
+    for key in redis.scan_iter(match="cryptoTrader.*.ifs.*", count=batch):
+        prefix, _, user_name = key.decode("utf-8").partition(".ifs.")
+        book = TriggerBook(pipe, prefix[len("cryptoTrader.") :])
+        for data in redis.hvals(key):
+            book.add(user_name, codec.decodeIf(data))
+            indexed += 1
+            if indexed % batch == 0:
+                pipe.execute()
+    pipe.execute()
+    print("indexed {} ifs".format(indexed))
+
+
+if __name__ == "__main__":
+    migrate_to_hashes()
+    index_users()
+    index_triggers()
 
 # def delete_all_ifs(prefix: str) -> None:
 #   for account, user in get_game(prefix):
@@ -2,13 +2,17 @@ import logging
 
 from chessbot.ChessBot import ChessBot
 from bot.Bot import SlackBot, Bot, threaded, allMessageEvents
-from bot.config import SLACK_TOKEN
+from bot import metrics
+from bot.config import BOT_LISTENER, SLACK_TOKEN
+from bot.mux import SlackMux
 from bot.redis import redis
+from bot.users import directory
 from slackclient import SlackClient
 from crypto.CryptoTrader import CryptoTrader
 from crypto.CryptoBot import CryptoBot
+from crypto.sources import ReplayPriceSource
 from arbitrage.ArbitrageBot import ArbitrageBot
-from multiprocessing import Process
+from multiprocessing import Process, Queue
 import http.server
 import socketserver
 import os
@@ -16,46 +20,83 @@ import os
 
 class MyServer(http.server.BaseHTTPRequestHandler):
     def do_GET(self):
+        if self.path == "/metrics":
+            body = metrics.render().encode()
+            self.send_response(200)
+            self.send_header("Content-type", "text/plain; version=0.0.4")
+            self.end_headers()
+            self.wfile.write(body)
+            return
         self.send_response(200)
         self.send_header("Content-type", "text/html")
         self.end_headers()
         return
 
 
+def registerChessRoutes(chess: ChessBot) -> None:
+    chess.register("chess start", chess.onStart, threaded)
+    chess.register("chess claim", chess.onClaim, threaded)
+    chess.register("chess board", chess.onBoard, threaded)
+    chess.register("chess move", chess.onMove, threaded)
+    chess.register("chess takeback", chess.onTakeback, threaded)
+    chess.register("chess forfeit", chess.onForfeit, threaded)
+    chess.register("chess record", chess.onRecord, threaded)
+    chess.register("chess leaderboard", chess.onLeaderboard, threaded)
+    chess.register("chess help", chess.onHelp, allMessageEvents)
+
+
+def registerCryptoRoutes(crypto: CryptoBot) -> None:
+    crypto.register("crypto prices", crypto.onPrices, allMessageEvents)
+    crypto.register("crypto price", crypto.onPrices, allMessageEvents)
+    crypto.register("crypto buy", crypto.onBuy, allMessageEvents)
+    crypto.register("crypto sell", crypto.onSell, allMessageEvents)
+    crypto.register("crypto leaderboard", crypto.onLeaderboard, allMessageEvents)
+    crypto.register("crypto top", crypto.onTopCoins, allMessageEvents)
+    crypto.register("crypto help", crypto.onHelp, allMessageEvents)
+    crypto.register("crypto play", crypto.onNewUser, allMessageEvents)
+    crypto.register("crypto quit", crypto.onUserQuit, allMessageEvents)
+    crypto.register("crypto ping", crypto.onPing, allMessageEvents)
+    crypto.register("crypto if", crypto.onIf, allMessageEvents)
+    crypto.register("crypto when", crypto.onWhen, allMessageEvents)
+    crypto.register("Reminder: crypto ping", crypto.onPing, allMessageEvents)
+
+
 if __name__ == "__main__":
     try:
-        chess = ChessBot(SLACK_TOKEN, Bot("chessbot", ":chess:"), redis)
-
-        # chess routes
-        chess.register("chess start", chess.onStart, threaded)
-        chess.register("chess claim", chess.onClaim, threaded)
-        chess.register("chess board", chess.onBoard, threaded)
-        chess.register("chess move", chess.onMove, threaded)
-        chess.register("chess takeback", chess.onTakeback, threaded)
-        chess.register("chess forfeit", chess.onForfeit, threaded)
-        chess.register("chess record", chess.onRecord, threaded)
-        chess.register("chess leaderboard", chess.onLeaderboard, threaded)
-        chess.register("chess help", chess.onHelp, allMessageEvents)
-
-        # trading routes
+        # prefetch slack users once, before the bots fork
+        directory.warm()
+
+        # one rtm connection, fanned out to the bots below
+        mux = SlackMux(SLACK_TOKEN)
+
+        chess = ChessBot(SLACK_TOKEN, Bot("chessbot", ":chess:"), redis, connect=False)
+        registerChessRoutes(chess)
+
+        # CMC_REPLAY plays back a recorded market instead of calling CoinMarketCap
+        replay = os.getenv("CMC_REPLAY")
         crypto = CryptoBot(
-            SLACK_TOKEN, Bot("cryptobot", ":doge:"), CryptoTrader(redis, "test")
+            SLACK_TOKEN,
+            Bot("cryptobot", ":doge:"),
+            CryptoTrader(
+                redis,
+                "test",
+                (
+                    ReplayPriceSource(replay, float(os.getenv("CMC_REPLAY_SPEED", 1)))
+                    if replay
+                    else None
+                ),
+            ),
+            connect=False,
         )
-        crypto.register("crypto prices", crypto.onPrices, allMessageEvents)
-        crypto.register("crypto price", crypto.onPrices, allMessageEvents)
-        crypto.register("crypto buy", crypto.onBuy, allMessageEvents)
-        crypto.register("crypto sell", crypto.onSell, allMessageEvents)
-        crypto.register("crypto leaderboard", crypto.onLeaderboard, allMessageEvents)
-        crypto.register("crypto top", crypto.onTopCoins, allMessageEvents)
-        crypto.register("crypto help", crypto.onHelp, allMessageEvents)
-        crypto.register("crypto play", crypto.onNewUser, allMessageEvents)
-        crypto.register("crypto quit", crypto.onUserQuit, allMessageEvents)
-        crypto.register("crypto ping", crypto.onPing, allMessageEvents)
-        crypto.register("crypto if", crypto.onIf, allMessageEvents)
-        crypto.register("crypto when", crypto.onWhen, allMessageEvents)
-        crypto.register("Reminder: crypto ping", crypto.onPing, allMessageEvents)
+        registerCryptoRoutes(crypto)
+
+        chessEvents: Queue = Queue()
+        cryptoEvents: Queue = Queue()
+        mux.route(chess, chessEvents)
+        mux.route(crypto, cryptoEvents)
 
         # arbitrage bot
+        # (keeps its own rtm connection)
         # arbitrage = ArbitrageBot(
         #     SLACK_TOKEN,
         #     Bot(
@@ -74,8 +115,10 @@ if __name__ == "__main__":
         server = http.server.HTTPServer(("", int(os.environ["PORT"])), MyServer)
 
         # start listening in parallel
-        Process(target=chess.listen).start()
-        Process(target=crypto.listen).start()
+        Process(target=chess.serve, args=(chessEvents,)).start()
+        Process(target=crypto.serve, args=(cryptoEvents,)).start()
+        listener = mux.listen if BOT_LISTENER == "poll" else mux.listenAsync
+        Process(target=listener).start()
         # Process(target=arbitrage.listen).start()
         Process(target=httpd.serve_forever).start()
         Process(target=server.serve_forever).start()
@@ -0,0 +1,94 @@
+# CryptoTrader against the client production gets: bot/redis.py builds it
+# with redis.from_url, which on redis 2.10 is the legacy Redis class, with
+# zadd(name, member, score) rather than StrictRedis' zadd(name, score, member).
+# needs a redis at REDIS_URL (default redis://localhost:6379); skipped without
+# usage: python -m unittest tests.test_from_url
+
+from crypto.CryptoTrader import CryptoTrader, netWorthKey
+from crypto.sources import PriceSource, snapshotOf
+import os
+import redis
+import time
+import unittest
+
+GROUP = "test.fromUrl"
+URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+
+
+class FixedMarket(PriceSource):
+    def __init__(self) -> None:
+        self.snapshot = snapshotOf({"btc": 10.0, "eth": 2.0}, time.time())
+
+    def getSnapshot(self):
+        return self.snapshot
+
+    def move(self, **prices: float) -> None:
+        # a new snapshot with these prices changed
+        changed = dict(self.snapshot.prices, **prices)
+        self.snapshot = snapshotOf(changed, self.snapshot.fetched_at_ms / 1000 + 60)
+
+
+class FromUrlTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.db = redis.from_url(URL)
+        try:
+            self.db.ping()
+        except redis.ConnectionError:
+            self.skipTest("no redis at {}".format(URL))
+        self.clear()
+        self.market = FixedMarket()
+        self.trader = CryptoTrader(self.db, GROUP, self.market)
+
+    def tearDown(self) -> None:
+        self.clear()
+
+    def clear(self) -> None:
+        keys = list(self.db.scan_iter(match="cryptoTrader.{}.*".format(GROUP)))
+        if keys:
+            self.db.delete(*keys)
+
+    def worth(self, user_name: str) -> float:
+        return self.db.zscore(netWorthKey(GROUP), user_name)
+
+    def test_buy_and_sell_update_net_worth(self) -> None:
+        trade = self.trader.buy("alice", "btc", "100")
+        self.assertEqual(trade.quantity, 100)
+        self.assertEqual(self.worth("alice"), CryptoTrader.INITIAL_POT_SIZE)
+        self.trader.sell("alice", "btc", "50")
+        self.assertEqual(self.worth("alice"), CryptoTrader.INITIAL_POT_SIZE)
+
+    def test_status_ranks_users(self) -> None:
+        self.trader.buy("alice", "btc", "1")
+        self.trader.create_user("bob")
+        self.assertIn("Ranked #", self.trader.status("bob"))
+        self.assertEqual(self.worth("bob"), CryptoTrader.INITIAL_POT_SIZE)
+
+    def test_revalue(self) -> None:
+        self.trader.buy("alice", "btc", "100")
+        self.trader.revalue(self.trader.getAllUsers())
+        self.assertEqual(self.worth("alice"), CryptoTrader.INITIAL_POT_SIZE)
+
+    def test_leaderboard_follows_prices(self) -> None:
+        self.market.move(doge=0.1)
+        self.trader.buy("alice", "btc", "100")
+        self.trader.buy("bob", "doge", "max")
+        self.market.move(doge=0.05)
+        rows = self.trader.leaderboardRows(1)
+        self.assertEqual([row[0] for row in rows], ["alice"])
+        # bob only moves up with the new snapshot, without trading
+        self.market.move(doge=10.0)
+        rows = self.trader.leaderboardRows(1)
+        self.assertEqual([row[0] for row in rows], ["bob"])
+        pot = CryptoTrader.INITIAL_POT_SIZE
+        self.assertEqual(rows[0][5], 100 * pot - pot)
+
+    def test_if_is_indexed_and_fires(self) -> None:
+        self.trader.setBuyIf("alice", "btc", "&gt;", 20.0, "eth", "1")
+        key = "cryptoTrader.{}.triggers.btc.gt".format(GROUP)
+        self.assertEqual(self.db.zscore(key, "1:alice"), 20.0)
+        triggered, _ = self.trader.triggered({"btc": 30.0, "eth": 2.0})
+        self.assertEqual([user.user_name for user, _ in triggered], ["alice"])
+
+
+if __name__ == "__main__":
+    unittest.main()